@@ -1,27 +1,46 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+import asyncio
 import os
+
+from bm25 import BM25Index
+from context_packer import ContextPacker
+from embedder import get_backend
+from embedding_cache import open_cache
+from extract_cache import ExtractCache
+from hybrid import HybridRetriever, bm25_leg, dense_leg
+from pdf_loader import extract_text_from_pdf
+from response_cache import ResponseCache
+from similarity import DenseIndex
+from streaming import StreamingRAG, openai_stream, print_stream
 # 加载环境变量
 from dotenv import load_dotenv, find_dotenv
 _ = load_dotenv(find_dotenv())  # 读取本地 .env 文件，里面定义了 OPENAI_API_KEY
 
 client = OpenAI()
 
-def get_completion(prompt, model="gpt-3.5-turbo-1106"):
-    '''封装 openai 接口'''
+def get_completion(prompt, model="gpt-3.5-turbo-1106", query=None, context=None):
+    '''封装 openai 接口；回答经过 response_cache，给出 query 与 context 时启用语义层'''
     messages = [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=0,  # 模型输出的随机性，0 表示随机性最小
-    )
-    return response.choices[0].message.content
-
-def build_prompt(prompt_template, **kwargs):
-    '''将 Prompt 模板赋值'''
+
+    def create():
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0,  # 模型输出的随机性，0 表示随机性最小
+        )
+        return response.choices[0].message.content
+
+    return response_cache.get_or_create(create, model, messages, temperature=0, query=query, context=context)
+
+# 资料按 token 预算打包：合并切分重叠的段落，按相关程度装入，超出预算的丢弃
+packer = ContextPacker(max_tokens=1500, model="gpt-3.5-turbo-1106")
+
+def build_prompt(prompt_template, packer=None, **kwargs):
+    '''将 Prompt 模板赋值；给出 packer 时字符串列表按 token 预算打包'''
     inputs = {}
     for k, v in kwargs.items():
         if isinstance(v, list) and all(isinstance(elem, str) for elem in v):
-            val = '\n\n'.join(v)
+            val = packer.pack(v) if packer is not None else '\n\n'.join(v)
         else:
             val = v
         inputs[k] = val
@@ -45,16 +64,55 @@ prompt_template = """
 user_query = "how many parameters does llama 2 have?"
 
 # 1. 检索
-search_results = ''
-# search_results = search(user_query, 2)
+# 混合检索：关键字（BM25）与向量两路并发执行，按倒数排名融合，同一段落只保留一次；
+# 每一路有自己的超时，慢的一路超时后只用另一路的结果
+paragraphs = extract_text_from_pdf("llama2.pdf", min_line_length=10, cache=ExtractCache())
+embedder = get_backend(create=client.embeddings.create)  # EMBEDDING_BACKEND=local 时不调用接口
+embedding_cache = open_cache(embedder.model, embedder.dimensions)
+vector_index = DenseIndex(embedding_cache.embed(paragraphs, embedder.embed))
+retriever = HybridRetriever(
+    {
+        "keyword": bm25_leg(BM25Index.build(paragraphs)),
+        # "keyword": es_leg(es, "teacher_demo_index_tmp", to_keywords),  # 检索引擎.py 中灌好的 ES 索引
+        "vector": dense_leg(vector_index, paragraphs, lambda q: embedding_cache.embed([q], embedder.embed)[0]),
+    },
+    timeouts={"keyword": 0.5, "vector": 3.0},
+)
+
+# 回答缓存（持久化）：相同的请求直接返回；除问题以外请求相同、问题的向量足够接近时复用已有回答
+# （python response_cache.py stats 查看累计命中与节省的时间）
+response_cache = ResponseCache(embed=lambda q: embedding_cache.embed([q], embedder.embed)[0], threshold=0.95)
 
 # 2. 构建 Prompt
-prompt = build_prompt(prompt_template, context=search_results, query=user_query)
-print("===Prompt===")
-print(prompt)
+prompts = []
+
+def build_rag_prompt(query, search_results):
+    prompt = build_prompt(prompt_template, packer=packer, context=search_results, query=query)
+    prompts.append(prompt)  # 流式输出结束后再打印，构建 prompt 的耗时不含打印
+    return prompt
 
 # 3. 调用 LLM
-response = get_completion(prompt)
+# 一次性返回：
+# search_results = retriever.search(user_query, 2)
+# prompt = build_rag_prompt(user_query, search_results)
+# response = get_completion(prompt, query=user_query, context=search_results)
+# print("===回复===")
+# print(response)
 
+# 流式：检索 -> 构建 Prompt -> 流式生成，首个 token 到达就开始打印，不必等完整的回答
+# （python bench_stream.py 对照一次性返回的首字延迟）；与 get_completion 共用回答缓存
+rag = StreamingRAG(
+    lambda q: retriever.search(q, 2),
+    build_rag_prompt,
+    openai_stream(AsyncOpenAI()),  # temperature=0：模型输出的随机性最小
+    model="gpt-3.5-turbo-1106",
+    cache=response_cache,
+)
 print("===回复===")
-print(response)
\ No newline at end of file
+response = asyncio.run(print_stream(rag.stream(user_query)))
+print(packer.last)  # 合并、丢弃的段落数与节省的 token 数
+print("===Prompt===")
+print(prompts[-1])
+print(retriever.last)  # 检索总耗时与各路的耗时、状态
+print(rag.last)  # 检索、构建 prompt、首个 token、生成的耗时（秒）与 token/秒
+print(response_cache.stats, "命中率 {:.0%}".format(response_cache.hit_rate()))
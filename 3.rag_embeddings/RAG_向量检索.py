@@ -1,13 +1,24 @@
+import os
+import tempfile
+
 import numpy as np
 from numpy import dot
 from numpy.linalg import norm
 from openai import OpenAI
 
+from embedder import get_backend
+from embedding_cache import open_cache
+from ann import IVFIndex
+from quantize import QuantizedIndex
+from similarity import DenseIndex, TwoStageIndex
+
 # 加载环境变量
 from dotenv import load_dotenv, find_dotenv
 _ = load_dotenv(find_dotenv())  # 读取本地 .env 文件，里面定义了 OPENAI_API_KEY
 
-client = OpenAI()
+# embedding 后端可插拔：EMBEDDING_BACKEND=local 时用本地哈希 n-gram 向量化，离线可用，不需要 API key
+backend = os.getenv("EMBEDDING_BACKEND", "openai")
+client = OpenAI() if backend == "openai" else None
 
 def cos_sim(a, b):
     '''余弦距离 -- 越大越相似'''
@@ -19,16 +30,19 @@ def l2(a, b):
     x = np.asarray(a)-np.asarray(b)
     return norm(x)
 
-def get_embeddings(texts, model="text-embedding-ada-002", dimensions=None):
-    '''封装 OpenAI 的 Embedding 模型接口'''
+def get_embeddings(texts, model="text-embedding-ada-002", dimensions=None, max_concurrency=8, rpm=None, tpm=None):
+    '''封装 OpenAI 的 Embedding 模型接口：先查本地缓存，未命中的按 token 预算自动分批、并发请求，结果与 texts 顺序一致
+
+    返回 (len(texts), 维度) 的 float32 矩阵（原来是 list[list[float]]），每行可以像列表一样取下标、切片；
+    矩阵是独立的副本，可以修改，需要 JSON 序列化时用 .tolist()
+    '''
     if model == "text-embedding-ada-002":
         dimensions = None
-    if dimensions:
-        data = client.embeddings.create(
-            input=texts, model=model, dimensions=dimensions).data
-    else:
-        data = client.embeddings.create(input=texts, model=model).data
-    return [x.embedding for x in data]
+    embedder = get_backend(backend, model, dimensions, create=client and client.embeddings.create,
+                           max_concurrency=max_concurrency, rpm=rpm, tpm=tpm)
+    # 相同文本的向量从本地缓存直接取出（内存映射的 float32 数组），只为新文本调用接口；
+    # 复制一份再返回，调用方修改结果不会碰到只读的映射区域
+    return np.array(open_cache(embedder.model, embedder.dimensions).embed(texts, embedder.embed))
 
 test_query = ["测试文本"]
 vec = get_embeddings(test_query)[0]
@@ -51,14 +65,60 @@ documents = [
 query_vec = get_embeddings([query])[0]
 doc_vecs = get_embeddings(documents)
 
+# 文档向量预先归一化存成一个矩阵，一次矩阵乘法算出所有分数（python bench_similarity.py 对比逐个计算的循环）
+cos_index = DenseIndex(doc_vecs, metric="cosine")
+l2_index = DenseIndex(doc_vecs, metric="l2")
+
 print("Query与自己的余弦距离: {:.2f}".format(cos_sim(query_vec, query_vec)))
 print("Query与Documents的余弦距离:")
-for vec in doc_vecs:
-    print(cos_sim(query_vec, vec))
+for score in cos_index.scores(query_vec):
+    print(score)
 
 print()
 
 print("Query与自己的欧氏距离: {:.2f}".format(l2(query_vec, query_vec)))
 print("Query与Documents的欧氏距离:")
-for vec in doc_vecs:
-    print(l2(query_vec, vec))
\ No newline at end of file
+for score in l2_index.scores(query_vec):
+    print(score)
+
+print()
+
+# 取最相似的 top-k（argpartition），返回文档下标与分数
+ids, scores = cos_index.search(query_vec, k=2)
+for i, score in zip(ids, scores):
+    print("{:.4f} {}".format(score, documents[i]))
+
+print()
+
+# 文档多了以后换成近似最近邻（IVF）索引：只扫描离查询最近的 nprobe 个倒排表，可以增删、保存后以 mmap 加载
+# （python bench_ann.py 查看 recall 与延迟）
+ann_index = IVFIndex.build(doc_vecs, nlist=2, nprobe=2)
+ann_path = os.path.join(tempfile.gettempdir(), "news.ivf")  # 不写到当前目录
+ann_index.save(ann_path)
+ann_index = IVFIndex.load(ann_path)
+ids, scores = ann_index.search(query_vec, k=2)
+for i, score in zip(ids, scores):
+    print("{:.4f} {}".format(score, documents[i]))
+
+print()
+
+# 向量压缩存储：int8 每维 1 字节（比 float32 小 4 倍，比 list[float] 小约 32 倍），查询向量不压缩直接与压缩码打分；
+# 给出原始向量时先按压缩码取 rescore 个候选再精确重排（python bench_quantize.py 查看各模式的内存与 recall）
+q_index = QuantizedIndex(doc_vecs, mode="int8", full=np.asarray(doc_vecs))
+ids, scores = q_index.search(query_vec, k=2, rescore=4)
+for i, score in zip(ids, scores):
+    print("{:.4f} {}".format(score, documents[i]))
+
+print()
+
+# Matryoshka 两阶段检索：text-embedding-3 的向量截取前 256 维（再归一化）即相当于 dimensions=256 的结果，
+# 只请求一次完整向量；粗排只用 256 维矩阵，再对前 candidates 个候选按完整维度重排
+# （python bench_matryoshka.py：计算量与常驻内存约为 1/6，recall 几乎不变）
+model = "text-embedding-3-small"
+doc_vecs = get_embeddings(documents, model=model)
+query_vec = get_embeddings([query], model=model)[0]
+# coarse = get_embeddings(documents, model=model, dimensions=256)  # 也可以直接请求低维向量，需要多调用一次接口
+two_stage = TwoStageIndex(doc_vecs, coarse_dim=256, candidates=4)
+ids, scores = two_stage.search(query_vec, k=2)
+for i, score in zip(ids, scores):
+    print("{:.4f} {}".format(score, documents[i]))
@@ -0,0 +1,259 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from similarity import MAX_SCORE_ELEMENTS, METRICS, normalize, top_k
+
+# 文件格式：魔数 | 头部长度 | 头部 JSON | 8 字节对齐的各数组（按倒排表分组存放，同一个表的向量连续）
+MAGIC = b'IVFIDX1\0'
+HEADER = struct.Struct('<8sQ')
+ARRAYS = [
+    ('centroids', np.float32),  # (nlist, dim) 聚类中心
+    ('offsets', np.int64),      # 第 l 个倒排表位于 [offsets[l], offsets[l+1])
+    ('ids', np.int64),          # 各行向量的外部编号
+    ('vectors', np.float32),    # (n, dim)
+]
+
+
+def _align(n):
+    return (n + 7) // 8 * 8
+
+
+def _similarity(queries, vectors, metric, sq_norms=None):
+    '''越大越相似的分数；l2 时为负的平方距离'''
+    scores = queries @ vectors.T
+    if metric == 'l2':
+        if sq_norms is None:
+            sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+        scores = 2 * scores - sq_norms - np.einsum('ij,ij->i', queries, queries)[:, None]
+    return scores
+
+
+def kmeans(vectors, k, metric='cosine', iterations=10, seed=0):
+    '''numpy 实现的 k-means（cosine 时为球面 k-means），返回 (k, dim) 的中心'''
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _similarity(vectors, centroids, metric).argmax(axis=1)
+        counts = np.bincount(assign, minlength=k)
+        # 按簇排序后用 reduceat 分段求和
+        order = np.argsort(assign, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(vectors[order], starts[~empty])
+        centroids = sums / np.maximum(counts, 1)[:, None]
+        # 空簇重新随机取点
+        centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        if metric == 'cosine':
+            centroids = normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    '''倒排文件（IVF）近似最近邻索引：向量按最近的聚类中心分到 nlist 个倒排表，查询只扫描最近的 nprobe 个表
+
+    insert / remove 不需要重新聚类：新向量先放在内存中的尾段（精确扫描），删除只打标记；
+    compact()（save 时自动进行）把尾段分配到各倒排表、去掉已删除的行。
+    load() 以内存映射方式加载，向量矩阵直接指向映射区域。
+    '''
+
+    def __init__(self, centroids, metric='cosine', nprobe=8, offsets=None, ids=None, vectors=None, trained_on=0,
+                 buffer=None):
+        if metric not in METRICS:
+            raise ValueError(f'metric 只能是 {METRICS} 之一')
+        self.metric = metric
+        self.nprobe = nprobe
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        dim = self.centroids.shape[1]
+        self.offsets = offsets if offsets is not None else np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        self.ids = ids if ids is not None else np.empty(0, dtype=np.int64)
+        self.vectors = vectors if vectors is not None else np.empty((0, dim), dtype=np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors) if metric == 'l2' else None
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        self.rows = None  # 外部编号 -> 行号，第一次删除时才建立
+        self.tail = {}    # 尚未 compact 的新向量：外部编号 -> 向量
+        self.trained_on = trained_on  # 聚类时的向量个数，语料增长很多后可以 retrain()
+        self._buffer = buffer
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    def __len__(self):
+        return len(self.ids) - int(self.deleted.sum()) + len(self.tail)
+
+    def _prepare(self, vectors):
+        vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+        return normalize(vectors) if self.metric == 'cosine' else vectors
+
+    @classmethod
+    def train(cls, vectors, nlist=None, metric='cosine', nprobe=8, iterations=10, max_samples=64, seed=0):
+        '''在（抽样的）向量上聚类得到空索引；nlist 默认约为 sqrt(n)'''
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if metric == 'cosine':
+            vectors = normalize(vectors)
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        trained_on = len(vectors)
+        rng = np.random.default_rng(seed)
+        if len(vectors) > nlist * max_samples:
+            vectors = vectors[rng.choice(len(vectors), nlist * max_samples, replace=False)]
+        return cls(kmeans(vectors, nlist, metric, iterations, seed), metric, nprobe, trained_on=trained_on)
+
+    @classmethod
+    def build(cls, vectors, ids=None, nlist=None, metric='cosine', nprobe=8, **kwargs):
+        '''聚类并一次性装入全部向量（编号不能重复）；ids 默认为 0..n-1'''
+        index = cls.train(vectors, nlist, metric, nprobe, **kwargs)
+        vectors = index._prepare(vectors)
+        ids = np.arange(len(vectors)) if ids is None else np.fromiter(ids, dtype=np.int64, count=len(vectors))
+        index._arrange(vectors, ids, index._assign(vectors))
+        return index
+
+    def retrain(self, nlist=None, **kwargs):
+        '''按当前的全部向量重新聚类并重建倒排表'''
+        self.compact()
+        fresh = self.build(self.vectors, self.ids, nlist, self.metric, self.nprobe, **kwargs)
+        self.__dict__.update(fresh.__dict__)
+
+    def _row_of(self, ident):
+        if self.rows is None:
+            self.rows = {int(ident): row for row, ident in enumerate(self.ids)}
+        return self.rows.get(ident)
+
+    def insert(self, vectors, ids=None):
+        '''插入（或按编号覆盖）向量；ids 默认接着已有的最大编号往后排'''
+        vectors = self._prepare(vectors)
+        if ids is None:
+            start = max([int(self.ids.max()) if len(self.ids) else -1, *self.tail]) + 1
+            ids = range(start, start + len(vectors))
+        for ident, vec in zip(ids, vectors):
+            self.remove([ident])
+            self.tail[int(ident)] = vec
+
+    def remove(self, ids):
+        for ident in ids:
+            ident = int(ident)
+            self.tail.pop(ident, None)
+            row = self._row_of(ident)
+            if row is not None:
+                self.deleted[row] = True
+
+    def compact(self):
+        '''把尾段并入倒排表、去掉已删除的行，并按倒排表重新排列（不重新聚类）'''
+        keep = ~self.deleted
+        # 已有的行沿用所在的倒排表，只给尾段的新向量分配
+        lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        vectors, ids, assign = [self.vectors[keep]], [self.ids[keep]], [lists[keep]]
+        if self.tail:
+            tail = np.stack(list(self.tail.values()))
+            vectors.append(tail)
+            ids.append(np.fromiter(self.tail, dtype=np.int64, count=len(self.tail)))
+            assign.append(self._assign(tail))
+        self._arrange(np.concatenate(vectors), np.concatenate(ids), np.concatenate(assign))
+
+    def _assign(self, vectors):
+        '''各向量最近的聚类中心，分块计算以限制分数矩阵的大小'''
+        step = max(1, MAX_SCORE_ELEMENTS // len(self.centroids))
+        return np.concatenate([_similarity(vectors[begin:begin+step], self.centroids, self.metric).argmax(axis=1)
+                               for begin in range(0, len(vectors), step)] or [np.empty(0, dtype=np.intp)])
+
+    def _arrange(self, vectors, ids, assign):
+        '''按倒排表重新排列各行'''
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.ids = ids[order]
+        self.sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors) if self.metric == 'l2' else None
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        self.rows = None
+        self.tail = {}
+        self._buffer = None
+
+    def _to_scores(self, similarity):
+        '''内部的相似度 -> 对外的分数（l2 时为欧氏距离）'''
+        if self.metric == 'l2':
+            return np.sqrt(np.maximum(-similarity, 0))
+        return similarity
+
+    def search(self, queries, k=10, nprobe=None):
+        '''返回 (编号, 分数)，按相似程度从高到低；单个查询 -> (k,)，多个 -> (Q, k)，不足 k 个时编号补 -1'''
+        queries = self._prepare(queries)
+        single = queries.ndim == 1
+        if single:
+            queries = queries.reshape(1, -1)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes, _ = top_k(_similarity(queries, self.centroids, self.metric), nprobe)
+        tail_ids = np.fromiter(self.tail, dtype=np.int64, count=len(self.tail))
+        tail_vectors = np.stack(list(self.tail.values())) if self.tail else None
+
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), np.nan, dtype=np.float32)
+        for qi, (query, lists) in enumerate(zip(queries, probes)):
+            cand_ids, cand_scores = [], []
+            for l in lists:
+                begin, end = self.offsets[l], self.offsets[l+1]
+                if begin == end:
+                    continue
+                sq = self.sq_norms[begin:end] if self.sq_norms is not None else None
+                scores = _similarity(query[None], self.vectors[begin:end], self.metric, sq)[0]
+                dead = self.deleted[begin:end]
+                if dead.any():
+                    scores = np.where(dead, -np.inf, scores)
+                cand_scores.append(scores)
+                cand_ids.append(self.ids[begin:end])
+            if tail_vectors is not None:
+                cand_scores.append(_similarity(query[None], tail_vectors, self.metric)[0])
+                cand_ids.append(tail_ids)
+            if not cand_scores:
+                continue
+            scores = np.concatenate(cand_scores)
+            found = int(np.isfinite(scores).sum())
+            pos, best = top_k(scores[None], min(k, found))
+            out_ids[qi, :pos.shape[1]] = np.concatenate(cand_ids)[pos[0]]
+            out_scores[qi, :pos.shape[1]] = self._to_scores(best[0])
+        return (out_ids[0], out_scores[0]) if single else (out_ids, out_scores)
+
+    def save(self, path):
+        '''先 compact，再原子写入文件'''
+        self.compact()
+        header = json.dumps({'metric': self.metric, 'nprobe': self.nprobe, 'dim': self.dim,
+                             'nlist': len(self.centroids), 'n': len(self.ids),
+                             'trained_on': self.trained_on}).encode('utf-8')
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(header)))
+            f.write(header)
+            pos = HEADER.size + len(header)
+            for name, dtype in ARRAYS:
+                f.write(b'\0' * (_align(pos) - pos))
+                data = np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes()
+                f.write(data)
+                pos = _align(pos) + len(data)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        '''以内存映射方式加载，不做反序列化；之后的 insert / remove 在内存中进行，save 时写回'''
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f'{path} 不是 IVF 索引文件')
+        header = json.loads(buffer[HEADER.size:HEADER.size+size])
+        shapes = {'centroids': (header['nlist'], header['dim']), 'offsets': (header['nlist'] + 1,),
+                  'ids': (header['n'],), 'vectors': (header['n'], header['dim'])}
+        pos = HEADER.size + size
+        arrays = {}
+        for name, dtype in ARRAYS:
+            pos = _align(pos)
+            count = int(np.prod(shapes[name]))
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=pos).reshape(shapes[name])
+            pos += count * np.dtype(dtype).itemsize
+        return cls(arrays['centroids'], header['metric'], nprobe or header['nprobe'],
+                   arrays['offsets'], arrays['ids'], arrays['vectors'], header['trained_on'], buffer)
@@ -0,0 +1,37 @@
+import argparse
+import time
+
+from es_index import bulk_ingest
+from local_es import LocalElasticsearch
+from pdf_loader import extract_text_from_pdf
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='在本地 ES 替身上对比不同批大小与在途请求数的灌库吞吐')
+    parser.add_argument('filename', nargs='?', default='llama2.pdf')
+    parser.add_argument('--copies', type=int, default=40, help='语料重复份数，放大数据量')
+    parser.add_argument('--latency', type=float, default=0.02, help='模拟每个 bulk 请求的往返时间（秒）')
+    parser.add_argument('--reject-rate', type=float, default=0.05, help='模拟 429 拒绝的比例')
+    parser.add_argument('--keywords', action='store_true', help='使用真实的关键字提取（需要 nltk 数据）')
+    args = parser.parse_args(argv)
+
+    paragraphs = extract_text_from_pdf(args.filename, min_line_length=10)
+    if args.keywords:
+        from keywords import to_keywords_batch as analyze
+    else:
+        def analyze(texts):
+            return [t.lower() for t in texts]
+
+    print(f"{'批大小':>6}{'在途':>6}{'文档':>8}{'失败':>6}{'请求数':>8}{'秒':>8}{'文档/秒':>10}")
+    for chunk_size, max_inflight in [(500, 1), (500, 4), (200, 4), (200, 8), (100, 16)]:
+        es = LocalElasticsearch(reject_rate=args.reject_rate, latency=args.latency)
+        chunks = ((f'{n}-{i}', p, {}) for n in range(args.copies) for i, p in enumerate(paragraphs))
+        start = time.perf_counter()
+        stats = bulk_ingest(es, 'bench', chunks, analyze, chunk_size, max_inflight, initial_backoff=0.01)
+        seconds = time.perf_counter() - start
+        print(f"{chunk_size:>6}{max_inflight:>6}{stats['docs']:>8}{stats['errors']:>6}{es.bulk_requests:>8}"
+              f"{seconds:>8.2f}{stats['docs_per_sec']:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import itertools
+import logging
+import os
+import time
+
+from openai import OpenAI
+from pypdf import PdfReader
+
+from chunker import ChunkStore
+from embedder import BatchEmbedder
+from mock_openai import MockOpenAI
+
+BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'langChain', '冯友兰《中国哲学史》.pdf')
+
+
+def load_chunks(n):
+    '''书中的 chunk 循环取满 n 个，末尾加编号保证各不相同'''
+    pages = [page.extract_text() for page in PdfReader(BOOK).pages]
+    chunks = itertools.cycle(ChunkStore(pages, 200, 60))
+    return [f'{chunk} #{i}' for i, chunk in zip(range(n), chunks)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='在本地 mock 接口上对比串行与并发批量 embedding 的吞吐')
+    parser.add_argument('--chunks', type=int, default=10000)
+    parser.add_argument('--rpm', type=int, default=3000)
+    parser.add_argument('--tpm', type=int, default=10000000)
+    parser.add_argument('--latency', type=float, default=0.2, help='mock 每个请求的固定耗时（秒）')
+    parser.add_argument('--per-token', type=float, default=2e-6, help='mock 每个 token 的耗时（秒）')
+    parser.add_argument('--max-tokens', type=int, default=20000, help='每批的 token 上限')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('pypdf').setLevel(logging.ERROR)
+    texts = load_chunks(args.chunks)
+
+    mock = MockOpenAI(rpm=args.rpm, tpm=args.tpm, latency=args.latency, per_token=args.per_token, burst=1.0)
+    with mock:
+        # 重试由 BatchEmbedder 负责，关掉客户端自带的重试
+        client = OpenAI(base_url=mock.base_url, api_key='mock', max_retries=0)
+
+        try:
+            client.embeddings.create(input=texts, model='text-embedding-ada-002')
+        except Exception as e:
+            print(f'原 get_embeddings（整个列表一次请求）: {type(e).__name__}')
+
+        print(f"{'并发':>4}{'客户端限速':>8}{'秒':>8}{'tokens/分钟':>14}{'占上限':>8}{'请求':>6}{'429':>6}{'重试':>6}{'拆批':>6}")
+        for concurrency, limited in [(1, True), (4, True), (8, True), (16, True), (16, False)]:
+            rate_limited = mock.stats['rate_limited']
+            embedder = BatchEmbedder(client.embeddings.create, max_tokens=args.max_tokens,
+                                     max_concurrency=concurrency, initial_backoff=0.2,
+                                     rpm=args.rpm if limited else None, tpm=args.tpm if limited else None)
+            time.sleep(2)  # 等 mock 的限速桶回满
+            vectors = embedder.embed(texts)
+            assert len(vectors) == len(texts)
+            tpm = embedder.throughput()['tokens_per_min']
+            stats = embedder.stats
+            print(f"{concurrency:>4}{'是' if limited else '否':>8}{stats['seconds']:>10.2f}{tpm:>14.0f}"
+                  f"{tpm / args.tpm:>9.0%}{stats['requests']:>7}{mock.stats['rate_limited'] - rate_limited:>6}"
+                  f"{stats['retries']:>6}{stats['splits']:>6}")
+
+
+if __name__ == '__main__':
+    main()
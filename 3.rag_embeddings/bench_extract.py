@@ -0,0 +1,48 @@
+import argparse
+import difflib
+import logging
+import time
+
+from pypdf import PdfReader
+
+from pdf_loader import BACKENDS, count_pages, extract_text_from_pdf, looks_degraded
+
+
+def agreement(a, b):
+    '''两份段落列表按词序列比较的相似度（0~1）'''
+    words_a = ' '.join(a).lower().split()
+    words_b = ' '.join(b).lower().split()
+    return difflib.SequenceMatcher(None, words_a, words_b, autojunk=False).ratio()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='对比 PDF 抽取后端的吞吐与输出一致性')
+    parser.add_argument('filename', nargs='?', default='llama2.pdf')
+    parser.add_argument('--repeat', type=int, default=3, help='每个后端重复次数，取最快一次')
+    parser.add_argument('--min-line-length', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    logging.getLogger('pypdf').setLevel(logging.ERROR)  # 屏蔽 pypdf 的字体警告
+    pages = count_pages(args.filename)
+    reader = PdfReader(args.filename)
+    degraded = sum(looks_degraded(page.extract_text()) for page in reader.pages)
+    print(f'{args.filename}: {pages} 页，pypdf 输出退化（auto 会回退到 pdfminer）的页: {degraded}')
+
+    results = {}
+    for backend in BACKENDS:
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            paragraphs = extract_text_from_pdf(args.filename, min_line_length=args.min_line_length, backend=backend)
+            best = min(best, time.perf_counter() - start)
+        results[backend] = (best, paragraphs)
+
+    reference = results['pdfminer'][1]
+    print(f"{'backend':<10}{'秒':>8}{'页/秒':>10}{'段落数':>8}{'与 pdfminer 一致度':>20}")
+    for backend, (seconds, paragraphs) in results.items():
+        print(f'{backend:<10}{seconds:>8.3f}{pages / seconds:>10.1f}{len(paragraphs):>8}'
+              f'{agreement(reference, paragraphs):>20.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from pypdf import PdfReader
+
+from bm25 import BM25Index
+from chunker import ChunkStore
+from extract_cache import ExtractCache
+from keywords import to_cjk_keywords, to_cjk_keywords_batch, to_keywords, to_keywords_batch
+
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'langChain', '冯友兰《中国哲学史》.pdf')
+QUERIES = ['兼爱', '天志和明鬼', '墨子的理想世界', '孔子论仁', '道家与法家', '公孙龙的名实论', '朱熹 理学']
+
+
+def load_chunks(filename, chunk_size, chunk_overlap):
+    '''逐页文字（带磁盘缓存）按中文句读切成 chunk'''
+    cache = ExtractCache()
+    key = cache.key_for_file(filename, kind='pypdf_pages')
+    entry = cache.get(key)
+    if entry is None:
+        pages = [page.extract_text() for page in PdfReader(filename).pages]
+        cache.put(key, pages, list(range(len(pages))))
+    else:
+        pages = entry.texts
+    return list(ChunkStore(pages, chunk_size, chunk_overlap))
+
+
+def measure(index, queries, repeat):
+    '''每个查询重复 repeat 次，返回 (各次耗时（毫秒）, 平均命中数)'''
+    latencies, hits = [], []
+    for query in queries:
+        hits.append(len(index.score(query)))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            index.search(query, 3)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, sum(hits) / len(hits)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='中文关键字检索（汉字二元组倒排表）的建索引耗时、索引大小与查询延迟')
+    parser.add_argument('filename', nargs='?', default=DEFAULT_PDF)
+    parser.add_argument('--chunk-size', type=int, default=200)
+    parser.add_argument('--chunk-overlap', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    logging.getLogger('pypdf').setLevel(logging.ERROR)
+    chunks = load_chunks(args.filename, args.chunk_size, args.chunk_overlap)
+    print(f'{os.path.basename(args.filename)}: {len(chunks)} 个 chunk，{sum(map(len, chunks))} 字')
+
+    modes = [('english', to_keywords_batch, to_keywords), ('cjk', to_cjk_keywords_batch, to_cjk_keywords)]
+    print(f"{'模式':<8}{'建索引秒':>10}{'词表':>8}{'倒排项':>10}{'数组KB':>9}{'文件KB':>9}"
+          f"{'平均命中':>9}{'平均ms':>9}{'p95 ms':>9}")
+    for mode, analyze_batch, analyze in modes:
+        try:
+            start = time.perf_counter()
+            index = BM25Index.build(chunks, analyze_batch, analyze)
+            seconds = time.perf_counter() - start
+        except LookupError:
+            print(f'{mode:<8}缺少 nltk 数据，跳过')
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.bm25')
+            index.save(path)
+            file_kb = os.path.getsize(path) / 1024
+            index = BM25Index.load(path, analyze)
+            latencies, hits = measure(index, QUERIES, args.repeat)
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(f'{mode:<8}{seconds:>10.2f}{len(index.vocab):>8}{len(index.doc_ids):>10}'
+                  f'{index.nbytes() / 1024:>9.0f}{file_kb:>9.0f}{hits:>9.1f}'
+                  f'{statistics.mean(latencies):>9.3f}{p95:>9.3f}')
+            del index  # 释放内存映射后临时目录才能删除
+
+    # 对照：逐个 chunk 做子串匹配
+    latencies = []
+    for query in QUERIES:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            [chunk for chunk in chunks if query in chunk]
+            latencies.append((time.perf_counter() - start) * 1000)
+    print(f"{'子串扫描':<6}{'':>60}{statistics.mean(latencies):>9.3f}{statistics.quantiles(latencies, n=20)[-1]:>9.3f}")
+
+    print('\n示例：', QUERIES[0])
+    for text in BM25Index.build(chunks, to_cjk_keywords_batch, to_cjk_keywords).search(QUERIES[0], 2):
+        print(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
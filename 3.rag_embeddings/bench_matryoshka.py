@@ -0,0 +1,72 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench_vectors import clustered, recall
+from similarity import DenseIndex, TwoStageIndex
+
+
+def matryoshka(n, dim, clusters, rng):
+    '''合成的 Matryoshka 式向量：成簇分布，各维的方差随维度递减，靠前的维度携带大部分信息'''
+    decay = (1 + np.arange(dim, dtype=np.float32) / 32) ** -0.5
+    return clustered(n, dim, clusters, rng, scale=decay)
+
+
+def timed(search, queries, batch):
+    '''单个查询逐个检索与一次批量检索的 ms/查询'''
+    start = time.perf_counter()
+    found = [search(q)[0] for q in queries]
+    single_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    start = time.perf_counter()
+    search(queries[:batch])
+    batch_ms = (time.perf_counter() - start) * 1000 / batch
+    return found, single_ms, batch_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Matryoshka 两阶段检索（低维粗排 + 完整向量重排）对照完整维度精确检索')
+    parser.add_argument('-n', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--coarse-dim', type=int, nargs='+', default=[128, 256, 512])
+    parser.add_argument('--candidates', type=int, nargs='+', default=[100, 200, 400])
+    parser.add_argument('--clusters', type=int, default=20, help='簇越少，簇内排序越依赖靠后的维度')
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    vectors = matryoshka(args.n + args.queries, args.dim, args.clusters, rng)
+    vectors, queries = vectors[:args.n], vectors[args.n:]
+
+    exact = DenseIndex(vectors, 'cosine')
+    expected, exact_ms, exact_batch_ms = timed(lambda q: exact.search(q, args.k), queries, args.queries)
+    full_mb = exact.matrix.nbytes / 2**20
+    print(f'{args.n} 个 {args.dim} 维向量，精确检索常驻 {full_mb:.0f} MB，'
+          f'{exact_ms:.2f} ms/查询（批量 {exact_batch_ms:.2f}）')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 完整向量放在磁盘上以内存映射方式读取，重排时只读候选行，不计入常驻内存
+        path = os.path.join(tmp, 'vectors.f32')
+        vectors.tofile(path)
+        full = np.memmap(path, dtype=np.float32, mode='r', shape=vectors.shape)
+
+        print(f"{'粗排维度':>6}{'候选':>6}{'常驻 MB':>9}{'内存比':>7}{'计算量比':>8}{'recall@' + str(args.k):>11}"
+              f"{'ms/查询':>9}{'加速':>7}{'批量 ms/查询':>12}{'加速':>7}")
+        for coarse_dim in args.coarse_dim:
+            index = TwoStageIndex(full, coarse_dim, metric='cosine')
+            coarse_mb = index.coarse.matrix.nbytes / 2**20
+            for candidates in args.candidates:
+                found, ms, batch_ms = timed(lambda q: index.search(q, args.k, candidates), queries, args.queries)
+                flops = args.n * args.dim / (args.n * coarse_dim + candidates * args.dim)
+                print(f'{coarse_dim:>10}{candidates:>8}{coarse_mb:>9.0f}{full_mb / coarse_mb:>8.1f}x{flops:>9.1f}x'
+                      f'{recall(found, expected):>11.3f}{ms:>9.2f}{exact_ms / ms:>6.1f}x'
+                      f'{batch_ms:>12.2f}{exact_batch_ms / batch_ms:>6.1f}x')
+            del index
+        del full  # 释放内存映射后临时目录才能删除
+
+
+if __name__ == '__main__':
+    main()
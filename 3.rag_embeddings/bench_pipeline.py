@@ -0,0 +1,129 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ann import IVFIndex
+from chunker import ChunkStore
+from embedder import get_backend
+from similarity import DenseIndex
+
+
+class SyntheticCorpus:
+    '''确定性的合成中文语料：词表为随机汉字组成的 2~4 字词，词频服从 Zipf 分布，夹带标点供切分'''
+
+    def __init__(self, vocab_size=50000, words_per_page=200, seed=0):
+        rng = np.random.default_rng(seed)
+        lengths = rng.integers(2, 5, vocab_size)
+        chars = rng.integers(0x4E00, 0x9FA6, lengths.sum())
+        bounds = np.concatenate([[0], np.cumsum(lengths)])
+        self.vocab = [''.join(map(chr, chars[bounds[i]:bounds[i+1]])) for i in range(vocab_size)]
+        self.vocab[:2] = ['，', '。']
+        weights = 1 / np.arange(1, vocab_size + 1) ** 1.1
+        self.p = weights / weights.sum()
+        self.words_per_page = words_per_page
+        self.seed = seed
+
+    def pages(self, batch_no, count):
+        '''第 batch_no 批的 count 页，同一批号总是生成相同的文字'''
+        rng = np.random.default_rng([self.seed, batch_no])
+        words = rng.choice(len(self.vocab), (count, self.words_per_page), p=self.p)
+        return [''.join(map(self.vocab.__getitem__, row)) for row in words.tolist()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='不调用接口的端到端压测：切分 -> 本地 embedding -> IVF 建索引 -> 查询')
+    parser.add_argument('--chunks', type=int, default=1000000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--pages-per-batch', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--backend', default='local', help='embedding 后端（见 embedder.get_backend）')
+    args = parser.parse_args(argv)
+
+    corpus = SyntheticCorpus()
+    embedder = get_backend(args.backend, dimensions=args.dim)
+    timings = {}
+
+    def stage(name, count, seconds):
+        count_, seconds_ = timings.get(name, (0, 0.0))
+        timings[name] = (count_ + count, seconds_ + seconds)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'vectors.f32')
+        queries, query_ids = [], []
+        rng = np.random.default_rng(1)
+        total, batch_no = 0, 0
+        with open(path, 'wb') as f:
+            while total < args.chunks:
+                start = time.perf_counter()
+                pages = corpus.pages(batch_no, args.pages_per_batch)
+                stage('生成文本（页）', len(pages), time.perf_counter() - start)
+
+                start = time.perf_counter()
+                store = ChunkStore(pages, chunk_size=200, chunk_overlap=60)
+                chunks = list(store)[:args.chunks - total]
+                stage('切分', len(chunks), time.perf_counter() - start)
+
+                start = time.perf_counter()
+                vectors = np.asarray(embedder.embed(chunks), dtype=np.float32)
+                f.write(vectors.tobytes())
+                stage('embedding', len(chunks), time.perf_counter() - start)
+
+                # 每批抽几个 chunk，用其中的一段作为查询，期望检索回原 chunk
+                for i in rng.choice(len(chunks), min(len(chunks), args.queries), replace=False):
+                    text = chunks[i]
+                    offset = int(rng.integers(0, len(text) // 2 + 1))
+                    queries.append(text[offset:offset + len(text) // 2])
+                    query_ids.append(total + i)
+                total += len(chunks)
+                batch_no += 1
+        keep = rng.choice(len(queries), min(args.queries, len(queries)), replace=False)
+        queries, query_ids = [queries[i] for i in keep], np.asarray(query_ids)[keep]
+        vectors = np.memmap(path, dtype=np.float32, mode='r', shape=(total, embedder.dimensions))
+
+        start = time.perf_counter()
+        index = IVFIndex.build(vectors, nprobe=args.nprobe)
+        stage('IVF 建索引', total, time.perf_counter() - start)
+        index_path = os.path.join(tmp, 'pipeline.ivf')
+        start = time.perf_counter()
+        index.save(index_path)
+        stage('保存', total, time.perf_counter() - start)
+        del index
+        start = time.perf_counter()
+        index = IVFIndex.load(index_path)
+        stage('mmap 加载', total, time.perf_counter() - start)
+
+        latencies, hits = [], 0
+        query_vectors = []
+        for query, expected in zip(queries, query_ids):
+            start = time.perf_counter()
+            vec = np.asarray(embedder.embed([query]), dtype=np.float32)[0]
+            ids, _ = index.search(vec, args.k)
+            latencies.append(time.perf_counter() - start)
+            hits += expected in ids
+            query_vectors.append(vec)
+        stage('查询（embedding + 检索）', len(queries), sum(latencies))
+
+        # 与精确检索对比 recall@k（只用部分查询，精确检索要扫描全部向量）
+        sample = np.stack(query_vectors[:20])
+        exact, _ = DenseIndex(vectors, 'cosine').search(sample, args.k)
+        found, _ = index.search(sample, args.k)
+        ann_recall = np.mean([len(set(f) & set(e)) / args.k for f, e in zip(found, exact)])
+
+        print(f'{total} 个 chunk，{embedder.dimensions} 维，后端 {embedder.model}，nlist={len(index.centroids)}，'
+              f'nprobe={args.nprobe}')
+        print(f"{'条数':>8}{'秒':>9}{'条/秒':>11}  阶段")
+        for name, (count, seconds) in timings.items():
+            print(f'{count:>10}{seconds:>10.2f}{count / max(seconds, 1e-9):>12.0f}  {name}')
+        latencies = np.asarray(latencies) * 1000
+        print(f'查询延迟 p50 {np.percentile(latencies, 50):.2f} ms，p99 {np.percentile(latencies, 99):.2f} ms；'
+              f'原 chunk 命中 top-{args.k}：{hits / len(queries):.3f}；IVF 对精确检索 recall@{args.k}：{ann_recall:.3f}')
+        del index, vectors  # 释放内存映射后临时目录才能删除
+
+
+if __name__ == '__main__':
+    main()
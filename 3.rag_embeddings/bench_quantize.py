@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_vectors import clustered, recall
+from quantize import QuantizedIndex
+from similarity import DenseIndex
+
+
+def list_bytes(vec):
+    '''get_embeddings 原来返回的 list[float]：列表本身加上每个装箱的 float'''
+    return sys.getsizeof(vec) + sum(sys.getsizeof(x) for x in vec)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='float16 / int8 / 乘积量化存储的内存占用与 recall@k（对照 float32 精确检索）')
+    parser.add_argument('-n', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--rescore', type=int, default=100, help='精确重排的候选个数')
+    parser.add_argument('--metric', default='cosine')
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    vectors = clustered(args.n + args.queries, args.dim, 500, rng)
+    vectors, queries = vectors[:args.n], vectors[args.n:]
+    expected, _ = DenseIndex(vectors, args.metric).search(queries, args.k)
+
+    per_list = list_bytes(vectors[0].tolist())
+    print(f'{args.n} 个 {args.dim} 维向量；list[float] 存储约 {per_list} 字节/向量，'
+          f'共 {per_list * args.n / 2**20:.0f} MB')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 重排用的原始向量放在磁盘上以内存映射方式读取，不计入常驻内存
+        path = os.path.join(tmp, 'vectors.f32')
+        vectors.tofile(path)
+        full = np.memmap(path, dtype=np.float32, mode='r', shape=vectors.shape)
+
+        print(f"{'模式':>8}{'字节/向量':>10}{'MB':>8}{'压缩比':>8}{'建索引 s':>10}{'recall@' + str(args.k):>11}"
+              f"{'ms/查询':>9}{'重排 recall':>12}{'ms/查询':>9}")
+        for mode in ('float32', 'float16', 'int8', 'pq'):
+            start = time.perf_counter()
+            index = QuantizedIndex(vectors, mode, args.metric, full=full)
+            build_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            found = [index.search(q, args.k)[0] for q in queries]
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            start = time.perf_counter()
+            rescored = [index.search(q, args.k, rescore=args.rescore)[0] for q in queries]
+            rescore_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            per_vector = index.nbytes() / args.n
+            print(f'{mode:>8}{per_vector:>12.0f}{index.nbytes() / 2**20:>8.1f}{per_list / per_vector:>9.0f}x'
+                  f'{build_s:>10.1f}{recall(found, expected):>11.3f}{ms:>9.2f}'
+                  f'{recall(rescored, expected):>12.3f}{rescore_ms:>9.2f}')
+        del full  # 释放内存映射后临时目录才能删除
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import time
+
+import numpy as np
+from numpy import dot
+from numpy.linalg import norm
+
+from similarity import DenseIndex
+
+
+def cos_sim(a, b):
+    '''RAG_向量检索.py 中的逐个打分写法'''
+    return dot(a, b)/(norm(a)*norm(b))
+
+
+def l2(a, b):
+    x = np.asarray(a)-np.asarray(b)
+    return norm(x)
+
+
+def loop_top_k(query, vectors, k, metric):
+    if metric == 'cosine':
+        scores = [cos_sim(query, vec) for vec in vectors]
+        return sorted(range(len(scores)), key=lambda i: -scores[i])[:k]
+    scores = [l2(query, vec) for vec in vectors]
+    return sorted(range(len(scores)), key=lambda i: scores[i])[:k]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='逐个打分的循环 vs 矩阵乘法 + argpartition 取 top-k')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--dim', type=int, default=256, help='向量维度（1M x 1536 维需要约 6GB 内存）')
+    parser.add_argument('--queries', type=int, default=32, help='矩阵版一次批量查询的个数')
+    parser.add_argument('--loop-queries', type=int, default=1, help='循环版测几个查询（取平均）')
+    parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f"{'向量数':>9}{'度量':>8}{'循环 ms/查询':>14}{'建索引 ms':>11}{'单查询 ms':>11}{'批量 ms/查询':>14}{'加速':>9}{'结果一致':>8}")
+    for n in args.sizes:
+        vectors = rng.standard_normal((n, args.dim), dtype=np.float32)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        for metric in ('cosine', 'l2'):
+            start = time.perf_counter()
+            expected = [loop_top_k(q, vectors, args.k, metric) for q in queries[:args.loop_queries]]
+            loop_ms = (time.perf_counter() - start) * 1000 / args.loop_queries
+
+            start = time.perf_counter()
+            index = DenseIndex(vectors, metric)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            single = [index.search(q, args.k)[0] for q in queries[:args.loop_queries]]
+            single_ms = (time.perf_counter() - start) * 1000 / args.loop_queries
+
+            start = time.perf_counter()
+            ids, _ = index.search(queries, args.k)
+            batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            same = all(list(a) == list(b) for a, b in zip(single, expected))
+            print(f"{n:>9}{metric:>8}{loop_ms:>14.1f}{build_ms:>11.1f}{single_ms:>11.2f}{batch_ms:>14.2f}"
+                  f"{loop_ms / batch_ms:>8.0f}x{'是' if same else '否':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+
+from bench_pipeline import SyntheticCorpus
+from chunker import ChunkStore
+from context_packer import ContextPacker
+from local_embedder import HashingEmbedder
+from mock_openai import MockOpenAI
+from similarity import DenseIndex
+from streaming import StreamingRAG, openai_stream
+
+PROMPT = '已知信息:\n{context}\n\n用户问：\n{query}\n\n请用中文回答用户问题。'
+
+
+def percentiles(values):
+    values = np.asarray([v for v in values if v is not None]) * 1000
+    return np.percentile(values, 50), np.percentile(values, 99)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='流式与一次性返回的 RAG 对照：各阶段耗时与首个 token 的延迟（本地 mock 接口）')
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4, help='流式请求的并发数')
+    parser.add_argument('-k', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.3, help='mock 接口首个 token 的耗时（秒）')
+    parser.add_argument('--token-latency', type=float, default=0.02, help='mock 接口每个 token 的耗时（秒）')
+    parser.add_argument('--answer-tokens', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    chunks = list(ChunkStore(SyntheticCorpus().pages(0, args.pages), chunk_size=200, chunk_overlap=60))
+    embedder = HashingEmbedder()
+    index = DenseIndex(embedder.embed(chunks))
+    packer = ContextPacker(max_tokens=1500, model='gpt-3.5-turbo')
+    rng = np.random.default_rng(0)
+    queries = [chunks[i][:40] for i in rng.choice(len(chunks), args.queries, replace=False)]
+
+    def retrieve(query):
+        ids, _ = index.search(embedder.embed([query])[0], args.k)
+        return [chunks[i] for i in ids]
+
+    def build_prompt(query, results):
+        return PROMPT.format(context=packer.pack(results), query=query)
+
+    with MockOpenAI(latency=args.latency, token_latency=args.token_latency,
+                    answer_tokens=args.answer_tokens) as mock:
+        # 一次性返回：生成完才能输出，用户感受到的首字延迟就是总耗时
+        client = OpenAI(base_url=mock.base_url, api_key='mock')
+        blocking = []
+        for query in queries:
+            start = time.perf_counter()
+            prompt = build_prompt(query, retrieve(query))
+            client.chat.completions.create(model='gpt-3.5-turbo', temperature=0,
+                                           messages=[{'role': 'user', 'content': prompt}])
+            blocking.append(time.perf_counter() - start)
+
+        # 流式：prompt 构建好就开始生成，首个 token 到达即可输出
+        rag = StreamingRAG(retrieve, build_prompt, openai_stream(AsyncOpenAI(base_url=mock.base_url, api_key='mock')))
+        reports = []
+
+        async def run(query, semaphore):
+            async with semaphore:
+                async for _ in rag.stream(query):
+                    pass
+                reports.append(rag.last)
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(args.concurrency)
+            start = time.perf_counter()
+            await asyncio.gather(*(run(q, semaphore) for q in queries))
+            return time.perf_counter() - start
+
+        wall = asyncio.run(run_all())
+
+    print(f'{len(chunks)} 个 chunk，{len(queries)} 个问题，top-{args.k}，mock 首 token {args.latency * 1000:.0f} ms、'
+          f'每 token {args.token_latency * 1000:.0f} ms、回答 {args.answer_tokens} 个 token')
+    print(f"{'p50 ms':>10}{'p99 ms':>10}  阶段")
+    rows = [('检索', [r['retrieval'] for r in reports]),
+            ('构建 prompt', [r['prompt'] for r in reports]),
+            ('首个 token（流式）', [r['ttft'] for r in reports]),
+            ('生成', [r['generation'] for r in reports]),
+            ('总耗时（流式）', [r['total'] for r in reports]),
+            ('首次输出（一次性返回）', blocking)]
+    for name, values in rows:
+        p50, p99 = percentiles(values)
+        print(f'{p50:>10.1f}{p99:>10.1f}  {name}')
+    speed = np.median([r['tokens_per_second'] for r in reports])
+    print(f'生成速度 p50 {speed:.0f} token/秒；流式 {args.concurrency} 并发，{len(queries)} 个问题共 {wall:.2f} 秒'
+          f'（一次性返回逐个执行共 {sum(blocking):.2f} 秒）')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+import numpy as np
+
+
+def clustered(n, dim, clusters, rng, scale=None):
+    '''成簇分布的随机向量，比均匀随机更接近真实 embedding；scale 为每一维的缩放（标量或长度为 dim 的数组）'''
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, n)
+    noise = rng.standard_normal((n, dim), dtype=np.float32)
+    if scale is not None:
+        centers, noise = centers * scale, noise * scale
+    return centers[labels] + noise
+
+
+def recall(found, expected):
+    '''各查询的 top-k 结果中命中精确 top-k 的比例，取平均'''
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)])
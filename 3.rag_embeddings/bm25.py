@@ -0,0 +1,163 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from keywords import to_keywords, to_keywords_batch
+
+# 文件格式：魔数 | 头部长度 | 头部 JSON（词表与参数）| 8 字节对齐的各数组 | UTF-8 文本
+MAGIC = b'BM25IDX1'
+HEADER = struct.Struct('<8sQ')
+# (字段名, array 类型码)，按此顺序写入文件；整数数组实际使用能容纳最大值的最小类型码，记录在头部
+ARRAYS = [
+    ('offsets', 'q'),     # 词 i 的倒排表位于 [offsets[i], offsets[i+1])
+    ('doc_ids', 'I'),     # 倒排表：文档编号（升序）
+    ('tfs', 'I'),         # 倒排表：词频
+    ('doc_norms', 'd'),   # 预先算好的 k1 * (1 - b + b * dl / avgdl)
+    ('doc_lens', 'I'),    # 文档长度（关键字个数）
+    ('text_offsets', 'q'),  # 原文第 i 段位于文本区 [text_offsets[i], text_offsets[i+1])
+]
+
+
+def _align(n):
+    return (n + 7) // 8 * 8
+
+
+def _compact(values):
+    '''无符号整数数组换成能容纳最大值的最小类型码，例如文档数 < 65536 时文档编号只占 2 字节'''
+    top = max(values, default=0)
+    for typecode in 'BHI':
+        if top < 1 << (8 * array(typecode).itemsize):
+            return values if values.typecode == typecode else array(typecode, values)
+    return values
+
+
+class BM25Index:
+    '''进程内的 BM25 倒排索引：search(query_string, top_n) 与 ES 版 search() 用法相同'''
+
+    def __init__(self, vocab, arrays, texts, k1=1.2, b=0.75, analyze=to_keywords, buffer=None):
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+        self.vocab = vocab
+        for name, _ in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.texts = texts  # bytes 或 mmap，按 text_offsets 取出原文
+        self.k1 = k1
+        self.b = b
+        self.analyze = analyze
+        self.idf = [self._idf(self.offsets[i+1] - self.offsets[i]) for i in range(len(vocab))]
+        self._buffer = buffer  # load() 时持有 mmap，避免被回收
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    def _idf(self, df):
+        n = len(self.doc_lens)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    @classmethod
+    def build(cls, texts, analyze_batch=to_keywords_batch, analyze=to_keywords, k1=1.2, b=0.75):
+        '''对文本列表提取关键字并建立索引'''
+        texts = list(texts)
+        postings = {}
+        doc_lens = array('I')
+        for doc_id, keywords in enumerate(analyze_batch(texts)):
+            terms = keywords.lower().split()
+            doc_lens.append(len(terms))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        vocab = sorted(postings)
+        offsets, doc_ids, tfs = array('q', [0]), array('I'), array('I')
+        for term in vocab:
+            for doc_id, tf in postings[term]:
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+            offsets.append(len(doc_ids))
+        avgdl = sum(doc_lens) / len(doc_lens) if doc_lens else 0.0
+        doc_norms = array('d', (k1 * (1 - b + b * dl / avgdl) if avgdl else k1 for dl in doc_lens))
+
+        data = [t.encode('utf-8') for t in texts]
+        text_offsets = array('q', [0])
+        for d in data:
+            text_offsets.append(text_offsets[-1] + len(d))
+        arrays = {'offsets': offsets, 'doc_ids': _compact(doc_ids), 'tfs': _compact(tfs), 'doc_norms': doc_norms,
+                  'doc_lens': _compact(doc_lens), 'text_offsets': text_offsets}
+        return cls(vocab, arrays, b''.join(data), k1, b, analyze)
+
+    def text(self, doc_id):
+        return bytes(self.texts[self.text_offsets[doc_id]:self.text_offsets[doc_id+1]]).decode('utf-8')
+
+    def score(self, query_string):
+        '''按 BM25 给包含查询关键字的文档打分，返回 {doc_id: score}'''
+        scores = {}
+        k1 = self.k1
+        for term in self.analyze(query_string).lower().split():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            idf = self.idf[term_id]
+            start, end = self.offsets[term_id], self.offsets[term_id+1]
+            for doc_id, tf in zip(self.doc_ids[start:end], self.tfs[start:end]):
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + self.doc_norms[doc_id])
+        return scores
+
+    def search_ids(self, query_string, top_n=3):
+        '''返回得分最高的 top_n 个 (doc_id, score)，用堆选 top-k'''
+        scores = self.score(query_string)
+        return heapq.nlargest(top_n, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def search(self, query_string, top_n=3):
+        return [self.text(doc_id) for doc_id, _ in self.search_ids(query_string, top_n)]
+
+    def _typecode(self, name):
+        values = getattr(self, name)
+        return values.typecode if isinstance(values, array) else values.format
+
+    def nbytes(self):
+        '''倒排表及各数组占用的字节数（不含词表与原文）'''
+        return sum(len(getattr(self, name)) * array(self._typecode(name)).itemsize for name, _ in ARRAYS)
+
+    def save(self, path):
+        '''原子写入文件：先写临时文件再替换，中途崩溃不会留下无法加载的索引'''
+        header = json.dumps({'vocab': self.vocab, 'k1': self.k1, 'b': self.b,
+                             'lengths': [len(getattr(self, name)) for name, _ in ARRAYS],
+                             'typecodes': [self._typecode(name) for name, _ in ARRAYS]},
+                            ensure_ascii=False).encode('utf-8')
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(header)))
+            f.write(header)
+            pos = HEADER.size + len(header)
+            for name, _ in ARRAYS:
+                f.write(b'\0' * (_align(pos) - pos))
+                data = getattr(self, name).tobytes()
+                f.write(data)
+                pos = _align(pos) + len(data)
+            f.write(bytes(self.texts))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, analyze=to_keywords):
+        '''以内存映射方式加载：倒排表等数组直接指向映射区域，不做反序列化'''
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f'{path} 不是 BM25 索引文件')
+        header = json.loads(buffer[HEADER.size:HEADER.size+size])
+        view = memoryview(buffer)
+        pos = HEADER.size + size
+        arrays = {}
+        for (name, _), typecode, length in zip(ARRAYS, header['typecodes'], header['lengths']):
+            pos = _align(pos)
+            nbytes = length * array(typecode).itemsize
+            arrays[name] = view[pos:pos+nbytes].cast(typecode)
+            pos += nbytes
+        return cls(header['vocab'], arrays, view[pos:], header['k1'], header['b'], analyze, buffer)
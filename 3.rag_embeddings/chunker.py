@@ -0,0 +1,111 @@
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+# 切分点按优先级排列：段落 > 句末（含中文 。！？）> 分句标点与空白
+BOUNDARY_PATTERNS = [
+    re.compile(r'\n\s*\n'),
+    re.compile(r'[。！？；…!?]+[”’」』）)]*|\.(?=\s)'),
+    re.compile(r'[，、,：:]|\s+'),
+]
+
+
+def find_boundaries(text):
+    '''返回各优先级的候选切分点（切在匹配内容之后），每级为升序列表'''
+    return [[m.end() for m in pattern.finditer(text)] for pattern in BOUNDARY_PATTERNS]
+
+
+def split_spans(text, chunk_size=200, chunk_overlap=60):
+    '''按长度与中英文句读切分，只产出 (start, end) 偏移量，不复制文字'''
+    n = len(text)
+    bounds = find_boundaries(text)
+
+    def skip_space(i):
+        while i < n and text[i].isspace():
+            i += 1
+        return i
+
+    start = skip_space(0)
+    while start < n:
+        end = n
+        limit = start + chunk_size
+        if limit < n:
+            end = limit
+            # 切分点至少落在 chunk 后半段，避免切得过碎
+            lowest = start + chunk_size // 2
+            for positions in bounds:
+                k = bisect_right(positions, limit) - 1
+                if k >= 0 and positions[k] > lowest:
+                    end = positions[k]
+                    break
+        stop = end
+        while stop > start and text[stop-1].isspace():
+            stop -= 1
+        yield start, stop
+        if end >= n:
+            break
+        # 下一个 chunk 与当前 chunk 重叠约 chunk_overlap 个字符，起点对齐到切分点
+        nxt = end - chunk_overlap
+        if nxt <= start:
+            nxt = end
+        else:
+            for positions in bounds:
+                k = bisect_left(positions, nxt)
+                if k < len(positions) and positions[k] < end:
+                    nxt = positions[k]
+                    break
+        start = skip_space(nxt)
+
+
+class ChunkStore:
+    '''所有文档拼接成一个共享文本缓冲区，chunk 只记录 (doc_id, start, end) 偏移量
+
+    可以当作只读的字符串序列使用：store[i] 在用到时才取出第 i 个 chunk 的文字
+    '''
+
+    def __init__(self, texts, chunk_size=200, chunk_overlap=60):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        texts = list(texts)
+        self.doc_offsets = array('q', [0])
+        self.chunk_docs = array('I')
+        self.chunk_starts = array('q')
+        self.chunk_ends = array('q')
+        for doc_id, text in enumerate(texts):
+            offset = self.doc_offsets[-1]
+            for start, end in split_spans(text, chunk_size, chunk_overlap):
+                self.chunk_docs.append(doc_id)
+                self.chunk_starts.append(offset + start)
+                self.chunk_ends.append(offset + end)
+            self.doc_offsets.append(offset + len(text))
+        self.buffer = ''.join(texts)
+
+    def __len__(self):
+        return len(self.chunk_docs)
+
+    def __getitem__(self, i):
+        '''取出第 i 个 chunk 的文字'''
+        return self.buffer[self.chunk_starts[i]:self.chunk_ends[i]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def span(self, i):
+        '''第 i 个 chunk 所在文档及文档内的 [start, end) 偏移'''
+        doc_id = self.chunk_docs[i]
+        offset = self.doc_offsets[doc_id]
+        return doc_id, self.chunk_starts[i] - offset, self.chunk_ends[i] - offset
+
+    def spans(self):
+        for i in range(len(self)):
+            yield self.span(i)
+
+    def document(self, doc_id):
+        return self.buffer[self.doc_offsets[doc_id]:self.doc_offsets[doc_id+1]]
+
+    def nbytes(self):
+        '''缓冲区与偏移数组实际占用的字节数'''
+        arrays = (self.doc_offsets, self.chunk_docs, self.chunk_starts, self.chunk_ends)
+        return sys.getsizeof(self.buffer) + sum(sys.getsizeof(a) for a in arrays)
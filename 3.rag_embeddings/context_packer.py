@@ -0,0 +1,123 @@
+import functools
+import threading
+
+from embedder import token_counter
+
+
+@functools.lru_cache(maxsize=None)
+def cached_token_counter(model='gpt-3.5-turbo', maxsize=8192):
+    '''每个模型只加载一次分词器；相同文本（检索到的 chunk 经常重复）的 token 数只算一次'''
+    return functools.lru_cache(maxsize=maxsize)(token_counter(model))
+
+
+def overlap(a, b, min_overlap=10):
+    '''a 的结尾与 b 的开头重合的字符数（至少 min_overlap 个，否则为 0）'''
+    head = b[:min_overlap]
+    if len(head) < min_overlap:
+        return 0
+    pos = a.find(head, max(0, len(a) - len(b)))
+    while pos != -1:
+        # 位置越靠前重合越长，第一个满足的就是最长的重合
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(head, pos + 1)
+    return 0
+
+
+def merge_chunks(chunks, min_overlap=10):
+    '''把首尾重合（切分时 chunk_overlap 造成）或互相包含的 chunk 合并成段落
+
+    chunks 按相关程度从高到低排列；返回 [(文字, 排名)]，排名为段落中最相关的 chunk 的排名，以及被合并掉的 chunk 数
+    '''
+    groups = []  # [文字, 排名]
+    merged = 0
+    for rank, text in enumerate(chunks):
+        groups.append([text, rank])
+        # 新加入的段落可能把两个已有段落连起来，合并到不再变化为止
+        changed = True
+        while changed:
+            changed = False
+            for i in range(len(groups)):
+                for j in range(len(groups)):
+                    if i == j:
+                        continue
+                    a, b = groups[i][0], groups[j][0]
+                    if b in a:
+                        text = a
+                    else:
+                        k = overlap(a, b, min_overlap)
+                        if not k:
+                            continue
+                        text = a + b[k:]
+                    groups[i] = [text, min(groups[i][1], groups[j][1])]
+                    del groups[j]
+                    merged += 1
+                    changed = True
+                    break
+                if changed:
+                    break
+    return [(text, rank) for text, rank in sorted(groups, key=lambda g: g[1])], merged
+
+
+class ContextPacker:
+    '''按 token 预算打包检索到的资料：先合并重合的 chunk，再按相关程度贪心装入，装不下的跳过；
+    只有最相关的一段单独就超出预算（一段都装不下）时，才截取它不超过预算的前缀
+
+    chunks 按相关程度从高到低传入（检索结果的顺序）；last 为最近一次的报告（合并数、丢弃数、节省的 token 数），
+    stats 为累计值。
+    '''
+
+    def __init__(self, max_tokens=2000, model='gpt-3.5-turbo', separator='\n\n', min_overlap=10):
+        self.max_tokens = max_tokens
+        self.separator = separator
+        self.min_overlap = min_overlap
+        self.count = cached_token_counter(model)
+        self.separator_tokens = self.count(separator) if separator else 0
+        self.last = None
+        self.stats = {'requests': 0, 'tokens_before': 0, 'tokens_after': 0, 'tokens_saved': 0}
+        self.lock = threading.Lock()
+
+    def pack_chunks(self, chunks):
+        '''返回装入预算的段落列表（按相关程度排列）'''
+        chunks = [c for c in chunks if c]
+        # 原来的做法：全部 chunk 用分隔符直接拼接
+        before = sum(self.count(c) for c in chunks) + self.separator_tokens * max(len(chunks) - 1, 0)
+        groups, merged = merge_chunks(chunks, self.min_overlap)
+
+        packed, used, dropped = [], 0, 0
+        for text, _ in groups:
+            cost = self.count(text) + (self.separator_tokens if packed else 0)
+            if used + cost > self.max_tokens:
+                dropped += 1
+                continue
+            packed.append(text)
+            used += cost
+        if not packed and groups:
+            # 最相关的一段单独就超出预算时，截取不超过预算的最长前缀（二分查找字符数），不至于一段资料都没有
+            text = self.truncate(groups[0][0])
+            packed, used, dropped = [text], self.count(text), dropped - 1
+
+        report = {'chunks': len(chunks), 'merged': merged, 'dropped': dropped, 'budget': self.max_tokens,
+                  'tokens_before': before, 'tokens_after': used, 'tokens_saved': before - used}
+        with self.lock:
+            self.last = report
+            self.stats['requests'] += 1
+            self.stats['tokens_before'] += before
+            self.stats['tokens_after'] += used
+            self.stats['tokens_saved'] += before - used
+        return packed
+
+    def truncate(self, text):
+        '''text 不超过 max_tokens 个 token 的最长前缀'''
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= self.max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+    def pack(self, chunks):
+        '''返回拼接好的资料文字'''
+        return self.separator.join(self.pack_chunks(chunks))
@@ -0,0 +1,197 @@
+import abc
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tiktoken
+except ImportError:  # 没有 tiktoken 时按 UTF-8 字节数保守估计 token 数
+    tiktoken = None
+
+# OpenAI embedding 接口的单请求上限
+MAX_INPUTS = 2048
+MAX_BATCH_TOKENS = 300000
+# 这些状态码重试也不会成功，直接把批次拆小（例如某条输入超长）
+NON_RETRYABLE = (400, 401, 403, 404, 413, 422)
+
+
+def estimate_tokens(text):
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+def token_counter(model='text-embedding-ada-002'):
+    '''返回 count(text) -> token 数'''
+    if tiktoken is None:
+        return estimate_tokens
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding('cl100k_base')
+    except Exception:  # 首次使用需要联网下载词表，离线时退回估计值
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def split_batches(token_counts, max_tokens=MAX_BATCH_TOKENS, max_inputs=MAX_INPUTS):
+    '''按 token 预算与条数上限把输入顺序切成 [start, end) 区间'''
+    batches = []
+    start, total = 0, 0
+    for i, n in enumerate(token_counts):
+        if i > start and (total + n > max_tokens or i - start >= max_inputs):
+            batches.append((start, i))
+            start, total = i, 0
+        total += n
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+class RateLimiter:
+    '''按每分钟请求数与 token 数限速的令牌桶（线程安全），桶容量为 burst 秒的额度'''
+
+    def __init__(self, rpm=None, tpm=None, burst=1.0, clock=time.monotonic):
+        self.limits = [(limit / 60.0, limit / 60.0 * burst) for limit in (rpm, tpm) if limit]
+        self.kinds = [kind for kind, limit in (('requests', rpm), ('tokens', tpm)) if limit]
+        self.levels = [capacity for _, capacity in self.limits]
+        self.clock = clock
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        '''额度足够时扣除并返回 0，否则返回还需等待的秒数；超过桶容量的大请求允许透支'''
+        costs = [1 if kind == 'requests' else tokens for kind in self.kinds]
+        with self.lock:
+            now = self.clock()
+            elapsed, self.updated = now - self.updated, now
+            self.levels = [min(capacity, level + rate * elapsed)
+                           for (rate, capacity), level in zip(self.limits, self.levels)]
+            wait = max([(min(cost, capacity) - level) / rate
+                        for (rate, capacity), level, cost in zip(self.limits, self.levels, costs)], default=0)
+            if wait <= 0:
+                self.levels = [level - cost for level, cost in zip(self.levels, costs)]
+                return 0
+            return wait
+
+    def acquire(self, tokens):
+        '''阻塞到额度足够：一次请求计 1 个请求和 tokens 个 token'''
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self, tokens):
+        return not self._reserve(tokens)
+
+
+class EmbeddingBackend(abc.ABC):
+    '''embedding 后端接口：embed(texts) 返回与 texts 一一对应的向量；model 与 dimensions 用作向量缓存的键'''
+
+    model = None
+    dimensions = None
+
+    @abc.abstractmethod
+    def embed(self, texts):
+        '''返回与 texts 一一对应的向量'''
+
+
+class BatchEmbedder(EmbeddingBackend):
+    '''批量 embedding：按 token 预算切批、线程池并发请求、结果与输入顺序一致
+
+    失败的批次单独退避重试，不影响其他批次；仍然失败时对半拆开再试，把出错的单条输入隔离出来。
+    create 为 client.embeddings.create 或兼容的函数。
+    '''
+
+    def __init__(self, create, model='text-embedding-ada-002', dimensions=None, max_tokens=MAX_BATCH_TOKENS,
+                 max_inputs=MAX_INPUTS, max_concurrency=8, max_retries=3, initial_backoff=0.5,
+                 rpm=None, tpm=None):
+        self.create = create
+        self.model = model
+        self.dimensions = dimensions
+        self.max_tokens = max_tokens
+        self.max_inputs = max_inputs
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.limiter = RateLimiter(rpm, tpm) if rpm or tpm else None
+        self.count_tokens = token_counter(model)
+        self.stats = {'inputs': 0, 'tokens': 0, 'requests': 0, 'retries': 0, 'splits': 0, 'seconds': 0.0}
+        self.lock = threading.Lock()
+
+    def _count(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def _call(self, texts, tokens):
+        if self.limiter is not None:
+            self.limiter.acquire(tokens)
+        kwargs = {'input': texts, 'model': self.model}
+        if self.dimensions:
+            kwargs['dimensions'] = self.dimensions
+        self._count(requests=1)
+        data = self.create(**kwargs).data
+        return [x.embedding for x in sorted(data, key=lambda x: x.index)]
+
+    def _embed_batch(self, texts, counts):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._call(texts, sum(counts))
+            except Exception as e:
+                error = e
+                if getattr(e, 'status_code', None) in NON_RETRYABLE or attempt == self.max_retries:
+                    break
+                self._count(retries=1)
+                time.sleep(self.initial_backoff * 2 ** attempt)
+        if len(texts) == 1:
+            raise error
+        self._count(splits=1)
+        mid = len(texts) // 2
+        return self._embed_batch(texts[:mid], counts[:mid]) + self._embed_batch(texts[mid:], counts[mid:])
+
+    def embed(self, texts):
+        '''返回与 texts 一一对应的向量列表'''
+        texts = list(texts)
+        start = time.perf_counter()
+        counts = [self.count_tokens(text) for text in texts]
+        batches = split_batches(counts, self.max_tokens, self.max_inputs)
+        vectors = []
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            for begin, end in batches:
+                vectors.extend(self._embed_batch(texts[begin:end], counts[begin:end]))
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                # map 按提交顺序返回结果，保证输出顺序
+                for batch in executor.map(lambda b: self._embed_batch(texts[b[0]:b[1]], counts[b[0]:b[1]]),
+                                          batches):
+                    vectors.extend(batch)
+        self._count(inputs=len(texts), tokens=sum(counts), seconds=time.perf_counter() - start)
+        return vectors
+
+    def throughput(self):
+        '''累计的每分钟 token 数与请求数'''
+        minutes = self.stats['seconds'] / 60
+        if not minutes:
+            return {'tokens_per_min': 0.0, 'requests_per_min': 0.0}
+        return {'tokens_per_min': self.stats['tokens'] / minutes, 'requests_per_min': self.stats['requests'] / minutes}
+
+
+def get_backend(backend=None, model='text-embedding-ada-002', dimensions=None, create=None, **kwargs):
+    '''按名称选择 embedding 后端，默认读环境变量 EMBEDDING_BACKEND
+
+    openai（默认）：调用 create（默认为 OpenAI().embeddings.create），kwargs 传给 BatchEmbedder
+    local：本地哈希 n-gram 向量化，不需要网络与 API key，dimensions 默认 256
+    '''
+    backend = backend or os.getenv('EMBEDDING_BACKEND', 'openai')
+    if backend == 'local':
+        from local_embedder import HashingEmbedder
+        return HashingEmbedder(dimensions or 256)
+    if backend == 'openai':
+        if create is None:
+            from openai import OpenAI
+            create = OpenAI().embeddings.create
+        return BatchEmbedder(create, model, dimensions, **kwargs)
+    raise ValueError(f'未知的 embedding 后端：{backend}')
@@ -0,0 +1,252 @@
+import hashlib
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只做进程内加锁
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', os.path.expanduser('~/.cache/chat-demo/embeddings'))
+
+# 索引文件：头部 | 开放寻址哈希表，每个槽位 = 文本 sha256 前 16 字节 + 行号+1（0 表示空槽）
+# 向量文件：连续的 float32 行，第 i 行即第 i 个写入的向量，没有头部
+MAGIC = b'EMBIDX1\0'
+HEADER = struct.Struct('<8sQQQ')  # 魔数, 维度, 槽位数, 已用槽位数
+SLOT = struct.Struct('<16sQ')
+INITIAL_CAPACITY = 1024
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).digest()[:16]
+
+
+def _slot_start(digest, capacity):
+    return int.from_bytes(digest[:8], 'little') & (capacity - 1)
+
+
+class EmbeddingCache:
+    '''按 (模型, 维度, 文本 sha256) 缓存 embedding 向量
+
+    向量存放在内存映射的 float32 文件中，查找直接在映射的哈希表上探测，取出的是映射区域上的 numpy 视图，
+    不做反序列化。写入只追加（先写向量再写槽位），并持有文件锁，其他进程的读者随时可以安全读取。
+    '''
+
+    def __init__(self, model, dimensions=None, root=DEFAULT_CACHE_DIR):
+        name = re.sub(r'[^A-Za-z0-9._-]', '_', f'{model}-{dimensions or "default"}')
+        self.dir = os.path.join(root, name)
+        os.makedirs(self.dir, exist_ok=True)
+        self.index_path = os.path.join(self.dir, 'index.bin')
+        self.vectors_path = os.path.join(self.dir, 'vectors.f32')
+        self.lock_path = os.path.join(self.dir, 'lock')
+        self.lock = threading.RLock()
+        self.index = None
+        self.index_ino = None
+        self.vectors = None
+        self.stats = {'hits': 0, 'misses': 0, 'embedded': 0, 'calls': 0}
+        if not os.path.exists(self.index_path):
+            with self._write_lock():
+                if not os.path.exists(self.index_path):
+                    self._create_index(self.index_path, dimensions or 0, INITIAL_CAPACITY)
+        self._open_index()
+
+    # ---- 文件映射 ----
+
+    @staticmethod
+    def _create_index(path, dims, capacity, slots=()):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        table = bytearray(capacity * SLOT.size)
+        count = 0
+        for digest, row in slots:
+            i = _slot_start(digest, capacity)
+            while table[i*SLOT.size+16:i*SLOT.size+24] != b'\0' * 8:
+                i = (i + 1) & (capacity - 1)
+            SLOT.pack_into(table, i * SLOT.size, digest, row)
+            count += 1
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, dims, capacity, count))
+            f.write(table)
+        os.replace(tmp, path)
+
+    def _open_index(self):
+        with open(self.index_path, 'r+b') as f:
+            self.index = mmap.mmap(f.fileno(), 0)
+            self.index_ino = os.fstat(f.fileno()).st_ino
+        magic, self.dims, self.capacity, _ = HEADER.unpack_from(self.index)
+        if magic != MAGIC:
+            raise ValueError(f'{self.index_path} 不是 embedding 缓存索引')
+        self.vectors = None
+
+    def _refresh_index(self):
+        '''索引被其他进程扩容替换过时重新映射；返回是否重新映射'''
+        try:
+            ino = os.stat(self.index_path).st_ino
+        except FileNotFoundError:
+            return False
+        if ino != self.index_ino:
+            self._open_index()
+            return True
+        self.dims = HEADER.unpack_from(self.index)[1]
+        return False
+
+    def _rows(self, row):
+        '''保证第 row 行已经映射进来，返回向量矩阵视图'''
+        if self.vectors is None or row >= len(self.vectors):
+            size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            rows = size // (4 * self.dims) if self.dims else 0
+            if rows == 0:
+                return None
+            with open(self.vectors_path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), rows * 4 * self.dims, access=mmap.ACCESS_READ)
+            self.vectors = np.frombuffer(buffer, dtype=np.float32).reshape(rows, self.dims)
+        return self.vectors
+
+    @contextmanager
+    def _write_lock(self):
+        with self.lock, open(self.lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ---- 查找 ----
+
+    def _find(self, digest):
+        '''返回行号，没有时返回 None'''
+        index, capacity = self.index, self.capacity
+        i = _slot_start(digest, capacity)
+        while True:
+            pos = HEADER.size + i * SLOT.size
+            slot_digest, row = SLOT.unpack_from(index, pos)
+            if row == 0:
+                return None
+            if slot_digest == digest:
+                return row - 1
+            i = (i + 1) & (capacity - 1)
+
+    def _lookup(self, digest):
+        row = self._find(digest)
+        if row is None:
+            return None
+        vectors = self._rows(row)
+        return vectors[row] if vectors is not None and row < len(vectors) else None
+
+    def get(self, text):
+        '''命中时返回只读的 float32 向量（映射区域上的视图），否则返回 None'''
+        return self.get_many([text])[0]
+
+    def get_many(self, texts):
+        with self.lock:
+            digests = [text_digest(text) for text in texts]
+            results = [self._lookup(d) for d in digests]
+            # 有未命中时确认索引是否被其他进程替换过，替换过就再查一遍
+            if any(r is None for r in results) and self._refresh_index():
+                results = [r if r is not None else self._lookup(d) for r, d in zip(results, digests)]
+            hits = sum(r is not None for r in results)
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(results) - hits
+            return results
+
+    # ---- 写入 ----
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._write_lock():
+            self._refresh_index()
+            if not self.dims:
+                self.dims = vectors.shape[1]
+                struct.pack_into('<Q', self.index, 8, self.dims)
+            elif vectors.shape[1] != self.dims:
+                raise ValueError(f'向量维度 {vectors.shape[1]} 与缓存的维度 {self.dims} 不一致')
+
+            new, seen = [], set()
+            for text, vec in zip(texts, vectors):
+                digest = text_digest(text)
+                if digest not in seen and self._find(digest) is None:
+                    seen.add(digest)
+                    new.append((digest, vec))
+            if not new:
+                return
+
+            count = HEADER.unpack_from(self.index)[3]
+            if (count + len(new)) * 2 > self.capacity:
+                self._grow(count + len(new))
+
+            row_bytes = 4 * self.dims
+            with open(self.vectors_path, 'ab') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % row_bytes:  # 上次写入中断留下的半行
+                    f.truncate(size - size % row_bytes)
+                    size -= size % row_bytes
+                f.write(np.stack([vec for _, vec in new]).tobytes())
+                f.flush()
+            first_row = size // row_bytes
+
+            # 向量落盘之后再写槽位：读者看到槽位时对应的向量一定已经存在
+            for k, (digest, _) in enumerate(new):
+                i = _slot_start(digest, self.capacity)
+                while SLOT.unpack_from(self.index, HEADER.size + i * SLOT.size)[1] != 0:
+                    i = (i + 1) & (self.capacity - 1)
+                pos = HEADER.size + i * SLOT.size
+                struct.pack_into('<Q', self.index, pos + 16, first_row + k + 1)
+                self.index[pos:pos+16] = digest
+            struct.pack_into('<Q', self.index, 24, count + len(new))
+            self.index.flush()
+
+    def _grow(self, needed):
+        '''扩容：写一个新的索引文件再原子替换，正在读旧索引的进程不受影响'''
+        capacity = self.capacity
+        while needed * 2 > capacity:
+            capacity *= 2
+        slots = []
+        for i in range(self.capacity):
+            digest, row = SLOT.unpack_from(self.index, HEADER.size + i * SLOT.size)
+            if row:
+                slots.append((digest, row))
+        self._create_index(self.index_path, self.dims, capacity, slots)
+        self._open_index()
+
+    def embed(self, texts, embed_fn):
+        '''先查缓存，只把未命中的文本交给 embed_fn(texts) -> 向量列表，结果写回缓存；返回与 texts 对应的向量'''
+        texts = list(texts)
+        results = self.get_many(texts)
+        missing = {}
+        for i, (text, vec) in enumerate(zip(texts, results)):
+            if vec is None:
+                missing.setdefault(text, []).append(i)
+        if missing:
+            todo = list(missing)
+            vectors = np.asarray(embed_fn(todo), dtype=np.float32)
+            self.stats['calls'] += 1
+            self.stats['embedded'] += len(todo)
+            self.put_many(todo, vectors)
+            for text, vec in zip(todo, vectors):
+                for i in missing[text]:
+                    results[i] = vec
+        return results
+
+    def __len__(self):
+        return HEADER.unpack_from(self.index)[3]
+
+
+_caches = {}
+
+
+def open_cache(model, dimensions=None, root=DEFAULT_CACHE_DIR):
+    '''同一进程内对同一个 (模型, 维度) 共用一个缓存对象'''
+    key = (model, dimensions, root)
+    if key not in _caches:
+        _caches[key] = EmbeddingCache(model, dimensions, root)
+    return _caches[key]
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from elasticsearch7 import helpers
+from elasticsearch7.exceptions import ConnectionError, NotFoundError
+
+from ingest import iter_batches
+
+# 灌库期间关闭刷新、不要副本，写完再恢复
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+# 关键字已在客户端切好（例如汉字二元组），keywords 字段只按空白切分，避免 standard 分词器再把汉字拆成单字
+KEYWORDS_MAPPING = {"mappings": {"properties": {"keywords": {"type": "text", "analyzer": "whitespace"}}}}
+
+
+def index_actions(index_name, chunks, analyze, chunk_size=500):
+    '''(chunk_id, text, metadata) 流 -> 按批提取关键字后的 bulk action 批次；chunk_id 为 None 时按内容生成 _id'''
+    for batch in iter_batches(chunks, chunk_size):
+        keywords = analyze([text for _, text, _ in batch])
+        actions = []
+        for (cid, text, metadata), kw in zip(batch, keywords):
+            source = {"keywords": kw, "text": text, **metadata}
+            actions.append({"_op_type": "index", "_index": index_name, "_id": cid or content_id(source),
+                            "_source": source})
+        yield actions
+
+
+def content_id(source):
+    '''按文档内容生成 _id：重发同一文档时覆盖而不是重复写入'''
+    data = json.dumps(source, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:24]
+
+
+def _send_batch(es, actions, max_retries, initial_backoff, ignore_status):
+    '''发送一批 action，返回失败条目；被 429 拒绝的文档由 streaming_bulk 退避后重发，连接错误则整批重发
+
+    整批重发时已写入的文档会再写一次，所以没有 _id 的 index action 先按内容补上 _id，重发只是覆盖
+    '''
+    for action in actions:
+        if action.get("_op_type", "index") == "index" and "_id" not in action:
+            action["_id"] = content_id(action.get("_source") or
+                                       {k: v for k, v in action.items() if not k.startswith("_")})
+    for attempt in range(max_retries + 1):
+        try:
+            results = helpers.streaming_bulk(
+                es, actions, chunk_size=len(actions), max_retries=max_retries,
+                initial_backoff=initial_backoff, raise_on_error=False, yield_ok=False,
+            )
+            return [info for _, info in results
+                    if next(iter(info.values())).get("status") not in ignore_status]
+        except ConnectionError:
+            if attempt == max_retries:
+                raise
+            time.sleep(initial_backoff * 2 ** attempt)
+
+
+def parallel_bulk(es, batches, max_inflight=4, max_retries=3, initial_backoff=0.5, ignore_status=(),
+                  progress=None):
+    '''并发发送 bulk 请求，同时在途的请求不超过 max_inflight 个
+
+    batches 通常是生成器：在途请求满了就先等其中一个返回，上游的抽取与关键字提取随之暂停（背压），
+    内存占用只与 max_inflight * 批大小有关，与语料大小无关。progress(stats) 在每批完成后调用。
+    '''
+    stats = {"docs": 0, "errors": 0, "batches": 0, "seconds": 0.0, "docs_per_sec": 0.0}
+    failed = []
+    start = time.perf_counter()
+
+    def collect(done):
+        for future in done:
+            size, errors = future.result()
+            stats["batches"] += 1
+            stats["docs"] += size - len(errors)
+            stats["errors"] += len(errors)
+            failed.extend(errors)
+            stats["seconds"] = time.perf_counter() - start
+            stats["docs_per_sec"] = stats["docs"] / stats["seconds"] if stats["seconds"] else 0.0
+            if progress is not None:
+                progress(stats)
+
+    def send(actions):
+        return len(actions), _send_batch(es, actions, max_retries, initial_backoff, ignore_status)
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        pending = set()
+        for actions in batches:
+            while len(pending) >= max_inflight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(send, actions))
+        collect(wait(pending).done)
+    stats["failed"] = failed
+    return stats
+
+
+def bulk_ingest(es, index_name, chunks, analyze, chunk_size=500, max_inflight=4, max_retries=3,
+                initial_backoff=0.5, progress=None):
+    '''流水线灌库：抽取（chunks 生成器）、关键字提取（主线程按批）与写入（线程池并发）三者重叠进行
+
+    chunks 为 (chunk_id, text, metadata) 的可迭代对象，返回写入统计（含 docs_per_sec）
+    '''
+    return parallel_bulk(es, index_actions(index_name, chunks, analyze, chunk_size),
+                         max_inflight, max_retries, initial_backoff, progress=progress)
+
+
+def alias_targets(es, alias):
+    '''别名当前指向的索引；alias 本身是普通索引（旧部署方式）时返回 [alias]，都不存在时返回 []'''
+    try:
+        return sorted(es.indices.get_alias(name=alias))
+    except NotFoundError:
+        return [alias] if es.indices.exists(index=alias) else []
+
+
+def rebuild_index(es, alias, load, body=None, keep=1):
+    '''零停机重建：新建带版本号的索引，load(新索引名) 灌满后原子切换别名，再清理旧版本
+
+    切换前所有查询都由旧索引服务；load 出错时删除新索引，别名保持不变。
+    keep 为切换后保留的旧版本个数（便于回滚），更早的版本会被删除。
+    body 为新索引的 mappings 等，默认为 KEYWORDS_MAPPING（keywords 字段只按空白切分）。
+    '''
+    start = time.perf_counter()
+    previous = alias_targets(es, alias)
+    new_index = version = f"{alias}-v{time.strftime('%Y%m%d%H%M%S')}"
+    n = 1
+    while es.indices.exists(index=new_index):
+        n += 1
+        new_index = f"{version}-{n}"
+    body = dict(body or KEYWORDS_MAPPING)
+    # 正式设置取自旧索引（没有时恢复为 ES 默认值），新索引先用灌库设置创建
+    live_settings = dict.fromkeys(BULK_LOAD_SETTINGS)
+    if previous:
+        current = es.indices.get_settings(index=previous[0])[previous[0]]["settings"]["index"]
+        live_settings.update({key: current[key] for key in BULK_LOAD_SETTINGS if key in current})
+    body["settings"] = {**body.get("settings", {}), **BULK_LOAD_SETTINGS}
+    es.indices.create(index=new_index, body=body)
+    try:
+        loaded = load(new_index)
+        es.indices.put_settings(index=new_index, body={"index": live_settings})
+        es.indices.refresh(index=new_index)
+    except BaseException:
+        es.indices.delete(index=new_index)
+        raise
+
+    # 一次 update_aliases 请求内的操作原子生效，查询不会落空
+    actions = [{"add": {"index": new_index, "alias": alias}}]
+    if previous == [alias]:
+        actions.insert(0, {"remove_index": {"index": alias}})
+    else:
+        actions[:0] = [{"remove": {"index": name, "alias": alias}} for name in previous]
+    es.indices.update_aliases(body={"actions": actions})
+
+    versions = sorted(name for name in es.indices.get(index=f"{alias}-v*") if name != new_index)
+    deleted = versions[:max(len(versions) - keep, 0)]
+    if deleted:
+        es.indices.delete(index=",".join(deleted))
+    return {"index": new_index, "previous": previous, "deleted": deleted, "loaded": loaded,
+            "seconds": time.perf_counter() - start}
+
+
+class ElasticsearchSink:
+    '''增量灌库的 Elasticsearch 目标：以 chunk 编号作为文档 _id'''
+
+    def __init__(self, es, index_name, analyze, chunk_size=500, max_inflight=4):
+        self.es = es
+        self.index_name = index_name
+        self.analyze = analyze  # 文本列表 -> 关键字字段列表，例如 to_keywords_batch
+        self.chunk_size = chunk_size
+        self.max_inflight = max_inflight
+        self.stats = None  # 最近一次 upsert 的写入统计
+
+    def upsert(self, chunks):
+        self.stats = bulk_ingest(self.es, self.index_name, chunks, self.analyze,
+                                 self.chunk_size, self.max_inflight)
+        if self.stats["failed"]:
+            raise helpers.BulkIndexError(f"{self.stats['errors']} document(s) failed to index.",
+                                         self.stats["failed"])
+
+    def delete(self, ids):
+        actions = ({"_op_type": "delete", "_index": self.index_name, "_id": cid} for cid in ids)
+        # 已经不存在的文档不算错误；其他失败抛出异常，增量灌库器不会保存清单，下次灌库重新删除
+        stats = parallel_bulk(self.es, iter_batches(actions, self.chunk_size), self.max_inflight,
+                              ignore_status=(404,))
+        if stats["failed"]:
+            raise helpers.BulkIndexError(f"{stats['errors']} document(s) failed to delete.", stats["failed"])
@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+DEFAULT_CACHE_DIR = os.getenv('EXTRACT_CACHE_DIR', os.path.expanduser('~/.cache/chat-demo/extract'))
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 文件格式：魔数 | 头部长度 | 头部 JSON | zlib(每条文本长度 u32 数组 + 位置 i32 数组 + UTF-8 文本)
+MAGIC = b'RAGC1'
+HEADER = struct.Struct('<5sI')
+
+CacheEntry = namedtuple('CacheEntry', ['texts', 'positions', 'meta'])
+
+_file_hashes = {}
+
+
+def file_sha256(filename):
+    '''计算文件内容的 sha256（按路径、大小、修改时间在进程内记忆）'''
+    stat = os.stat(filename)
+    sig = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    if sig not in _file_hashes:
+        h = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _file_hashes[sig] = h.hexdigest()
+    return _file_hashes[sig]
+
+
+def texts_sha256(texts):
+    '''计算一组文本内容的 sha256'''
+    h = hashlib.sha256()
+    for text in texts:
+        data = text.encode('utf-8')
+        h.update(struct.pack('<I', len(data)))
+        h.update(data)
+    return h.hexdigest()
+
+
+def _encode(texts, positions, meta):
+    datas = [t.encode('utf-8') for t in texts]
+    lengths = array('I', [len(d) for d in datas])
+    pos = array('i', positions if positions is not None else [])
+    meta = dict(meta or {}, count=len(datas), has_positions=positions is not None)
+    header = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    body = zlib.compress(lengths.tobytes() + pos.tobytes() + b''.join(datas), 1)
+    return HEADER.pack(MAGIC, len(header)) + header + body
+
+
+def _decode_header(raw):
+    magic, size = HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise ValueError('不是抽取缓存文件')
+    return json.loads(raw[HEADER.size:HEADER.size+size]), HEADER.size + size
+
+
+def _decode(raw):
+    meta, offset = _decode_header(raw)
+    body = zlib.decompress(raw[offset:])
+    n = meta['count']
+    lengths = array('I')
+    lengths.frombytes(body[:4*n])
+    offset = 4*n
+    positions = None
+    if meta['has_positions']:
+        positions = array('i')
+        positions.frombytes(body[offset:offset+4*n])
+        positions = positions.tolist()
+        offset += 4*n
+    if len(lengths) != n or offset + sum(lengths) != len(body):
+        raise ValueError('抽取缓存文件不完整')
+    texts = []
+    for length in lengths:
+        texts.append(body[offset:offset+length].decode('utf-8'))
+        offset += length
+    return CacheEntry(texts, positions, meta)
+
+
+class ExtractCache:
+    '''按内容寻址的 PDF 抽取结果磁盘缓存，总大小超限时按最近最少使用淘汰'''
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None  # 缓存目录的总大小：第一次写入时扫描一次，之后随写入与删除累加
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(source_hash, **params):
+        '''由源内容哈希与抽取/切分参数生成缓存键'''
+        payload = json.dumps([source_hash, params], sort_keys=True, ensure_ascii=False, default=list)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def key_for_file(self, filename, **params):
+        return self.make_key(file_sha256(filename), **params)
+
+    def key_for_texts(self, texts, **params):
+        return self.make_key(texts_sha256(texts), **params)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.bin')
+
+    def get(self, key):
+        '''读取缓存，未命中返回 None；命中时刷新访问时间供 LRU 使用；损坏的条目删除后按未命中处理'''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        try:
+            return _decode(raw)
+        except (zlib.error, ValueError, struct.error, KeyError):
+            self.purge(key)
+            return None
+
+    def _file_size(self, key):
+        try:
+            return os.stat(self._path(key)).st_size
+        except FileNotFoundError:
+            return 0
+
+    def size(self):
+        '''缓存条目的总大小（字节）'''
+        if self._size is None:
+            self._size = sum(e.stat().st_size for e in os.scandir(self.root) if e.name.endswith('.bin'))
+        return self._size
+
+    def put(self, key, texts, positions=None, meta=None):
+        '''写入缓存（先写临时文件再原子替换）；总大小超过上限时才扫描目录按 LRU 淘汰'''
+        texts = list(texts)
+        data = _encode(texts, positions, meta)
+        total = self.size() - self._file_size(key)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+        self._size = total + len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+        return texts
+
+    def entries(self):
+        '''列出缓存条目，按最近访问时间从旧到新排序'''
+        result = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.bin'):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+                with open(path, 'rb') as f:
+                    meta, _ = _decode_header(f.read(64 * 1024))
+            except (FileNotFoundError, ValueError, struct.error):
+                continue
+            result.append({'key': name[:-4], 'size': stat.st_size, 'atime': stat.st_mtime, 'meta': meta})
+        return sorted(result, key=lambda e: e['atime'])
+
+    def evict(self, max_bytes=None):
+        '''删除最久未使用的条目，直到总大小不超过上限，返回删除的键'''
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(e['size'] for e in entries)
+        removed = []
+        for e in entries:
+            if total <= max_bytes:
+                break
+            self.purge(e['key'])
+            total -= e['size']
+            removed.append(e['key'])
+        # 以扫描结果校正累计的大小（其他进程也可能写过这个目录）
+        self._size = total
+        return removed
+
+    def purge(self, key=None):
+        '''删除指定条目；key 为空时清空整个缓存'''
+        keys = [key] if key else [e['key'] for e in self.entries()]
+        for k in keys:
+            size = self._file_size(k)
+            try:
+                os.remove(self._path(k))
+            except FileNotFoundError:
+                continue
+            if self._size is not None:
+                self._size = max(self._size - size, 0)
+        return keys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='查看与清理 PDF 抽取缓存')
+    parser.add_argument('--dir', default=DEFAULT_CACHE_DIR, help='缓存目录')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='列出缓存条目')
+    sub.add_parser('stats', help='统计条目数与总大小')
+    purge = sub.add_parser('purge', help='删除条目')
+    purge.add_argument('key', nargs='?', help='要删除的缓存键，不填则清空')
+    shrink = sub.add_parser('evict', help='按 LRU 淘汰到指定大小')
+    shrink.add_argument('max_mb', type=float, help='保留的最大容量（MB）')
+    args = parser.parse_args(argv)
+
+    cache = ExtractCache(args.dir, max_bytes=sys.maxsize)
+    if args.command == 'list':
+        for e in cache.entries():
+            accessed = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(e['atime']))
+            meta = {k: v for k, v in e['meta'].items() if k != 'has_positions'}
+            print(f"{e['key'][:16]}  {e['size']/1024:10.1f} KB  {accessed}  {json.dumps(meta, ensure_ascii=False)}")
+    elif args.command == 'stats':
+        entries = cache.entries()
+        print(f"{len(entries)} 条，共 {sum(e['size'] for e in entries)/1024/1024:.2f} MB（{cache.root}）")
+    elif args.command == 'purge':
+        key = args.key
+        if key and len(key) < 64:
+            # 允许用 list 输出的前缀删除
+            matches = [e['key'] for e in cache.entries() if e['key'].startswith(key)]
+            if len(matches) != 1:
+                parser.error(f'前缀 {key} 匹配到 {len(matches)} 个条目')
+            key = matches[0]
+        print(f'已删除 {len(cache.purge(key))} 条')
+    elif args.command == 'evict':
+        print(f'已淘汰 {len(cache.evict(int(args.max_mb * 1024 * 1024)))} 条')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import numpy as np
+
+# 倒数排名融合的平滑常数，取常用的 60
+RRF_K = 60
+
+
+def rrf_fuse(rankings, k=RRF_K, weights=None):
+    '''倒数排名融合：score(d) = Σ weight / (k + rank)，rank 从 1 开始
+
+    rankings 为 {路名: [(chunk 编号, 内容), ...]}，同一编号只保留第一次出现的内容；
+    返回按分数从高到低的 [(编号, 内容, 分数)]，分数相同时按首次出现的顺序。
+    '''
+    weights = weights or {}
+    scores, items = {}, {}
+    for name, hits in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, (key, item) in enumerate(hits, 1):
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+            items.setdefault(key, item)
+    order = sorted(scores, key=lambda key: -scores[key])  # sorted 是稳定的
+    return [(key, items[key], scores[key]) for key in order]
+
+
+class HybridRetriever:
+    '''多路检索（关键字、向量……）并发执行，按倒数排名融合（RRF），按 chunk 编号去重
+
+    legs 为 {路名: search(query, n) -> [(chunk 编号, 内容)] 或 [文字]}，只有文字时以文字本身去重。
+    每一路有自己的超时：超时或出错的一路被丢弃，只用按时返回的结果融合，
+    所以总延迟约为各路中最慢的那一路（不超过它的超时），而不是各路之和。
+    '''
+
+    def __init__(self, legs, timeouts=None, default_timeout=2.0, k=RRF_K, weights=None, fetch=None):
+        self.legs = dict(legs)
+        self.timeouts = {name: (timeouts or {}).get(name, default_timeout) for name in self.legs}
+        self.k = k
+        self.weights = weights
+        self.fetch = fetch  # 每一路取多少个候选，默认 top_n 的 3 倍
+        # 超时的一路仍在后台运行，多留一些线程给后续的检索
+        self.executor = ThreadPoolExecutor(max_workers=4 * len(self.legs), thread_name_prefix='hybrid')
+        self.last = None  # 最近一次检索的耗时与各路状态
+        self.stats = {'searches': 0, 'timeouts': 0, 'errors': 0}
+
+    @staticmethod
+    def _run(search, query, n):
+        start = time.perf_counter()
+        hits = [hit if isinstance(hit, tuple) else (hit, hit) for hit in search(query, n)]
+        return hits, time.perf_counter() - start
+
+    def search_hits(self, query, top_n=3):
+        '''返回融合后的 [(编号, 内容, 分数)]'''
+        start = time.perf_counter()
+        fetch = self.fetch or top_n * 3
+        futures = {name: self.executor.submit(self._run, search, query, fetch) for name, search in self.legs.items()}
+        rankings, legs = {}, {}
+        for name, future in futures.items():
+            # 各路同时开始，按各自的截止时刻等待
+            remaining = max(0.0, start + self.timeouts[name] - time.perf_counter())
+            try:
+                hits, seconds = future.result(timeout=remaining)
+            except TimeoutError:
+                future.cancel()
+                self.stats['timeouts'] += 1
+                legs[name] = {'status': 'timeout', 'seconds': self.timeouts[name], 'hits': 0}
+                continue
+            except Exception as e:
+                self.stats['errors'] += 1
+                legs[name] = {'status': f'error: {e!r}', 'seconds': None, 'hits': 0}
+                continue
+            rankings[name] = hits
+            legs[name] = {'status': 'ok', 'seconds': seconds, 'hits': len(hits)}
+        fused = rrf_fuse(rankings, self.k, self.weights)[:top_n]
+        self.stats['searches'] += 1
+        self.last = {'seconds': time.perf_counter() - start, 'legs': legs}
+        return fused
+
+    def search(self, query, top_n=3):
+        '''与 search() 用法相同：返回内容列表，可以直接传给 build_prompt'''
+        return [item for _, item, _ in self.search_hits(query, top_n)]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def bm25_leg(index):
+    '''BM25Index 的一路：以文档下标为编号'''
+    def search(query, n):
+        return [(doc_id, index.text(doc_id)) for doc_id, _ in index.search_ids(query, n)]
+    return search
+
+
+def dense_leg(index, texts, embed_query):
+    '''DenseIndex / IVFIndex 等向量索引的一路：embed_query(query) 返回查询向量，以下标为编号'''
+    def search(query, n):
+        ids, _ = index.search(np.asarray(embed_query(query), dtype=np.float32), n)
+        return [(int(i), texts[i]) for i in ids if i >= 0]
+    return search
+
+
+def es_leg(es, index_name, analyze):
+    '''ES 关键字检索的一路：以文档 _id 为编号（增量灌库时即 chunk 编号）'''
+    def search(query, n):
+        res = es.search(index=index_name, query={"match": {"keywords": analyze(query)}}, size=n)
+        return [(hit["_id"], hit["_source"]["text"]) for hit in res["hits"]["hits"]]
+    return search
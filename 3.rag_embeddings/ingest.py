@@ -0,0 +1,203 @@
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+
+from pypdf import PdfReader
+
+from extract_cache import file_sha256
+from pdf_loader import iter_page_lines, iter_page_paragraphs
+
+DEFAULT_MANIFEST_DIR = os.getenv('INGEST_MANIFEST_DIR', os.path.expanduser('~/.cache/chat-demo/ingest'))
+
+
+def page_fingerprints(filename):
+    '''每页原始内容流的 sha1，只解压内容流，不做文字抽取'''
+    fingerprints = []
+    for page in PdfReader(filename).pages:
+        contents = page.get_contents()
+        data = contents.get_data() if contents is not None else b''
+        fingerprints.append(hashlib.sha1(data).hexdigest())
+    return fingerprints
+
+
+def text_fingerprint(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def chunk_id(source, text):
+    '''按内容生成 chunk 编号：同一来源中文字相同的 chunk 编号相同'''
+    return hashlib.sha1(f'{source}\0{text}'.encode('utf-8')).hexdigest()[:24]
+
+
+def iter_batches(items, size):
+    '''把任意可迭代对象按 size 个一组切成列表，不预先读完'''
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def pdf_paragraphs(min_line_length=1, backend='pdfminer'):
+    '''抽取段落的 chunk 函数：fn(filename, page_numbers) 一次解析这些页，按页码顺序产出 (页码, 段落)
+
+    跨页的段落归入开始的那一页；全部页都抽取时与 extract_text_from_pdf 的段落相同
+    '''
+    def chunk_pages(filename, page_numbers):
+        return iter_page_paragraphs(iter_page_lines(filename, page_numbers, backend), min_line_length)
+    return chunk_pages
+
+
+def _page_cursor(items):
+    '''(页码, chunk) 按页码顺序的流 -> take(页码) 返回该页的 chunk 列表；只向前读，页码必须递增'''
+    groups = itertools.groupby(items, key=lambda item: item[0])
+    current = None
+
+    def take(page_no):
+        nonlocal current
+        if current is None or current[0] < page_no:
+            # 跳过比 page_no 小的页（这些页没有被取）
+            current = next(((page, [chunk for _, chunk in group]) for page, group in groups if page >= page_no),
+                           (float('inf'), []))
+        return current[1] if current[0] == page_no else []
+    return take
+
+
+class IncrementalIngestor:
+    '''按页与 chunk 指纹做增量灌库：只处理新增或修改过的页，只把新 chunk 交给 sink，消失的 chunk 从 sink 删除
+
+    sink 需要实现 upsert(chunks) 与 delete([chunk_id])：chunks 是 (chunk_id, text, metadata) 的生成器，
+    sink 按批消费、边读边写，抽取与写入重叠进行，内存只与批大小有关；upsert 必须把 chunks 读完
+    '''
+
+    def __init__(self, name, sink, params=None, manifest_dir=DEFAULT_MANIFEST_DIR):
+        self.sink = sink
+        # params 记录切分参数等，参数变化时视为全部页都已修改
+        self.params = params or {}
+        os.makedirs(manifest_dir, exist_ok=True)
+        self.manifest_path = os.path.join(manifest_dir, name + '.json')
+        self._load()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        self.stamp = self._stamp()
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self._version = None
+
+    def corpus_version(self):
+        '''语料版本：清单内容的指纹，只有灌库真正改变了语料时才会变化；其他进程写过清单时重新加载'''
+        if self._stamp() != self.stamp:
+            self._load()
+        if self._version is None:
+            data = json.dumps(self.manifest, sort_keys=True).encode('utf-8')
+            self._version = hashlib.sha1(data).hexdigest()[:16]
+        return self._version
+
+    def forget(self, source=None):
+        '''清空清单（例如目标索引被重建时），下次灌库会全部重新处理'''
+        if source is None:
+            self.manifest = {}
+        else:
+            self.manifest.pop(source, None)
+        self._save()
+
+    def _save(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.manifest_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+        self.stamp = self._stamp()
+        self._version = None
+
+    def _previous(self, source):
+        '''来源上次灌库的清单；切分参数变化时视为没有灌过'''
+        old = self.manifest.get(source, {})
+        return old if old.get('params') == self.params else {}
+
+    def sync(self, source, pages, version=None):
+        '''pages 为按页顺序的 [(页指纹, chunk_fn)]，chunk_fn() 只在该页是新页时才被调用，按页码顺序调用'''
+        old = self._previous(source)
+        if version is not None and old.get('version') == version:
+            return {'source': source, 'skipped': True, 'pages': len(old['pages']), 'pages_processed': 0,
+                    'chunks_added': 0, 'chunks_deleted': 0}
+        old_pages = old.get('pages', {})
+        old_ids = {cid for ids in old_pages.values() for cid in ids}
+
+        new_pages = {}
+        added = set()
+
+        def upserts():
+            for page_no, (fingerprint, chunk_fn) in enumerate(pages):
+                if fingerprint in new_pages:
+                    continue
+                if fingerprint in old_pages:
+                    new_pages[fingerprint] = old_pages[fingerprint]
+                    continue
+                ids = []
+                for text in chunk_fn():
+                    cid = chunk_id(source, text)
+                    ids.append(cid)
+                    if cid not in old_ids and cid not in added:
+                        added.add(cid)
+                        yield cid, text, {'source': source, 'page': page_no}
+                new_pages[fingerprint] = ids
+
+        chunks = upserts()
+        self.sink.upsert(chunks)
+        if next(chunks, None) is not None:
+            raise RuntimeError('sink.upsert() did not consume all chunks')
+        # 新 chunk 的编号与旧 chunk 不重合，全部页处理完才知道哪些旧 chunk 已消失
+        new_ids = {cid for ids in new_pages.values() for cid in ids}
+        deletes = sorted(old_ids - new_ids)
+        if deletes:
+            self.sink.delete(deletes)
+        self.manifest[source] = {'params': self.params, 'version': version, 'pages': new_pages}
+        self._save()
+        return {'source': source, 'skipped': False, 'pages': len(new_pages),
+                'pages_processed': sum(1 for fp in new_pages if fp not in old_pages),
+                'chunks_added': len(added), 'chunks_deleted': len(deletes)}
+
+    def ingest_pdf(self, filename, chunk_pages):
+        '''增量灌入一个 PDF：文件未变时直接跳过；否则按页内容流指纹找出变化的页，只抽取这些页
+
+        chunk_pages(filename, page_numbers) 按页码顺序产出 (页码, chunk)（见 pdf_paragraphs）；
+        变化的页一次解析（只打开一次文件、只走一遍页树），边解析边交给 sink
+        '''
+        source = os.path.basename(filename)
+
+        def pages():
+            # 生成器：文件未变时 sync 直接返回，连页指纹都不用计算
+            fingerprints = page_fingerprints(filename)
+            # 与 sync 的判断相同：清单中没有、在本文件中第一次出现的指纹才是新页
+            seen = set(self._previous(source).get('pages', {}))
+            changed = []
+            for i, fp in enumerate(fingerprints):
+                if fp not in seen:
+                    seen.add(fp)
+                    changed.append(i)
+            take = _page_cursor(chunk_pages(filename, changed))
+            for i, fp in enumerate(fingerprints):
+                yield fp, lambda i=i: take(i)
+        return self.sync(source, pages(), file_sha256(filename))
+
+    def ingest_texts(self, source, texts, split):
+        '''增量灌入已抽取好的逐页文本，split(text) 返回该页的 chunk 列表'''
+        fingerprints = [text_fingerprint(text) for text in texts]
+        version = hashlib.sha1(''.join(fingerprints).encode('ascii')).hexdigest()
+        pages = [(fp, lambda text=text: split(text)) for fp, text in zip(fingerprints, texts)]
+        return self.sync(source, pages, version)
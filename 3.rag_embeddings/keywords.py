@@ -0,0 +1,107 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
+from nltk.tokenize import word_tokenize
+
+NON_ALNUM = re.compile(r'[^a-zA-Z0-9\s]')
+# 连续的中日韩文字（CJK 统一汉字及扩展 A、兼容汉字、日文假名、韩文音节），或连续的英文字母数字
+CJK_OR_ALNUM = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)|([a-zA-Z0-9]+)')
+
+
+class KeywordAnalyzer:
+    '''（英文）关键字提取：停用词表与词干提取器只加载一次，词干结果放在 LRU 缓存中复用'''
+
+    def __init__(self, language='english', cache_size=65536):
+        self.stop_words = set(stopwords.words(language))
+        self.stemmer = PorterStemmer()
+        self.stem = lru_cache(maxsize=cache_size)(self.stemmer.stem)
+
+    def to_keywords(self, input_string):
+        '''文本只保留关键字，结果与原 to_keywords 一致'''
+        # 使用正则表达式替换所有非字母数字的字符为空格
+        no_symbols = NON_ALNUM.sub(' ', input_string)
+        word_tokens = word_tokenize(no_symbols)
+        # 去停用词，取词根
+        stop_words = self.stop_words
+        stem = self.stem
+        return ' '.join(stem(w) for w in word_tokens if w.lower() not in stop_words)
+
+    def to_keywords_batch(self, paragraphs):
+        return [self.to_keywords(p) for p in paragraphs]
+
+
+def cjk_bigrams(run):
+    '''连续的汉字切成相邻两字的二元组：中国哲学 -> 中国 国哲 哲学；单字保留原样'''
+    if len(run) == 1:
+        return [run]
+    return [run[i:i+2] for i in range(len(run) - 1)]
+
+
+class CJKAnalyzer:
+    '''中英混排文本的关键字提取：汉字按二元组切分（不需要分词词典），英文数字小写后取词根
+
+    不依赖 nltk 数据；查询与文档用同一种切分，任意两个相邻汉字都能命中倒排表
+    '''
+
+    def __init__(self, cache_size=65536):
+        self.stemmer = PorterStemmer()
+        self.stem = lru_cache(maxsize=cache_size)(self.stemmer.stem)
+
+    def to_keywords(self, input_string):
+        keywords = []
+        for cjk, alnum in CJK_OR_ALNUM.findall(input_string):
+            if cjk:
+                keywords.extend(cjk_bigrams(cjk))
+            else:
+                keywords.append(self.stem(alnum))
+        return ' '.join(keywords)
+
+    def to_keywords_batch(self, paragraphs):
+        return [self.to_keywords(p) for p in paragraphs]
+
+
+ANALYZERS = {
+    'english': KeywordAnalyzer,
+    'cjk': CJKAnalyzer,
+}
+_analyzers = {}
+
+
+def default_analyzer(mode='english'):
+    '''进程内共享的分析器（子进程中各自初始化一次）'''
+    if mode not in _analyzers:
+        _analyzers[mode] = ANALYZERS[mode]()
+    return _analyzers[mode]
+
+
+def to_keywords(input_string, mode='english'):
+    '''文本只保留关键字；mode='cjk' 时汉字按二元组切分'''
+    return default_analyzer(mode).to_keywords(input_string)
+
+
+def _analyze_chunk(paragraphs, mode='english'):
+    return default_analyzer(mode).to_keywords_batch(paragraphs)
+
+
+def to_keywords_batch(paragraphs, workers=1, chunk_size=256, mode='english'):
+    '''批量提取关键字，结果顺序与输入一致；workers>1 时分块交给进程池处理'''
+    paragraphs = list(paragraphs)
+    if workers <= 1 or len(paragraphs) <= chunk_size:
+        return default_analyzer(mode).to_keywords_batch(paragraphs)
+    chunks = [paragraphs[i:i+chunk_size] for i in range(0, len(paragraphs), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for keywords in executor.map(_analyze_chunk, chunks, [mode] * len(chunks)):
+            results.extend(keywords)
+    return results
+
+
+def to_cjk_keywords(input_string):
+    return to_keywords(input_string, mode='cjk')
+
+
+def to_cjk_keywords_batch(paragraphs, workers=1, chunk_size=256):
+    return to_keywords_batch(paragraphs, workers, chunk_size, mode='cjk')
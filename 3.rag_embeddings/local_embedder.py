@@ -0,0 +1,73 @@
+import numpy as np
+
+from embedder import EmbeddingBackend
+from similarity import normalize
+
+# 64 位乘法散列的常数（黄金分割）
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+# n-gram 的滚动哈希基数
+BASE = np.uint64(0x100000001B3)
+# 一次向量化处理的字符数上限，控制中间数组的内存
+BATCH_CHARS = 1 << 22
+
+
+def _mix(h):
+    '''64 位哈希的最终混合，让低位也均匀'''
+    h = h ^ (h >> np.uint64(33))
+    h = h * GOLDEN
+    return h ^ (h >> np.uint64(29))
+
+
+class HashingEmbedder(EmbeddingBackend):
+    '''本地的哈希 n-gram 向量化：字符 n-gram 带符号地哈希到 dimensions 个桶，log(1 + tf) 后归一化为单位向量
+
+    只依赖文本内容（不受 Python 哈希随机化影响），同一文本在任何机器、任何进程上得到相同的向量，
+    不需要网络与 API key。字面重合多的文本余弦相似度高，但没有语义理解，适合离线压测灌库、建索引与检索流程。
+    一批文本拼成一个码点数组整体计算，不逐个 n-gram 循环。
+    '''
+
+    def __init__(self, dimensions=256, ngrams=(1, 2, 3)):
+        self.dimensions = dimensions
+        self.ngrams = tuple(ngrams)
+        self.model = 'hashing-ngram-' + '-'.join(map(str, self.ngrams))
+
+    def embed(self, texts):
+        '''返回 (len(texts), dimensions) 的 float32 矩阵'''
+        texts = list(texts)
+        out = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        begin = 0
+        while begin < len(texts):
+            end, chars = begin, 0
+            while end < len(texts) and (end == begin or chars + len(texts[end]) <= BATCH_CHARS):
+                chars += len(texts[end]) + 1
+                end += 1
+            out[begin:end] = self._embed_batch(texts[begin:end])
+            begin = end
+        return out
+
+    def _embed_batch(self, texts):
+        # 各文本以 \0 分隔拼成一个码点数组，跨越分隔符的 n-gram 丢弃
+        texts = [text.lower() for text in texts]
+        codes = np.frombuffer('\0'.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        lengths = np.fromiter((len(t) + 1 for t in texts), dtype=np.int64, count=len(texts))
+        doc = np.repeat(np.arange(len(texts)), lengths)[:len(codes)]
+        seps = np.concatenate([[0], np.cumsum(codes == 0)])
+        keys, weights = [], []
+        for n in self.ngrams:
+            count = len(codes) - n + 1
+            if count <= 0:
+                continue
+            h = np.full(count, n, dtype=np.uint64)
+            for j in range(n):
+                h = h * BASE + codes[j:j+count]
+            h = _mix(h)
+            valid = seps[n:n+count] == seps[:count]  # 窗口内没有分隔符
+            h, start = h[valid], np.flatnonzero(valid)
+            buckets = ((h >> np.uint64(1)) % np.uint64(self.dimensions)).astype(np.int64)
+            keys.append(doc[start] * self.dimensions + buckets)
+            weights.append(1.0 - 2.0 * (h & np.uint64(1)))
+        if not keys:
+            return np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        tf = np.bincount(np.concatenate(keys), np.concatenate(weights),
+                         minlength=len(texts) * self.dimensions).reshape(len(texts), self.dimensions)
+        return normalize(np.sign(tf) * np.log1p(np.abs(tf)))
@@ -0,0 +1,208 @@
+import fnmatch
+import itertools
+import json
+import math
+import random
+import threading
+import time
+
+from elasticsearch7.exceptions import NotFoundError
+from elasticsearch7.serializer import JSONSerializer
+
+
+class _Transport:
+    serializer = JSONSerializer()
+
+
+class _Indices:
+    def __init__(self, es):
+        self.es = es
+
+    def exists(self, index, **kwargs):
+        return all(self.es._resolve(name, missing_ok=True) for name in index.split(','))
+
+    def create(self, index, body=None, **kwargs):
+        body = body or {}
+        with self.es.lock:
+            self.es.indices_data[index] = {
+                'docs': {},
+                'settings': dict(body.get('settings', {})),
+                'mappings': body.get('mappings', {}),
+            }
+        return {'acknowledged': True, 'index': index}
+
+    def get(self, index, **kwargs):
+        '''支持逗号分隔与通配符'''
+        names = set()
+        for pattern in index.split(','):
+            names.update(fnmatch.filter(self.es.indices_data, pattern) if '*' in pattern
+                         else self.es._resolve(pattern))
+        return {name: {'aliases': {alias: {} for alias, members in self.es.aliases.items() if name in members},
+                       'settings': {'index': dict(self.es.indices_data[name]['settings'])}}
+                for name in sorted(names)}
+
+    def delete(self, index, **kwargs):
+        with self.es.lock:
+            for name in index.split(','):
+                if name not in self.es.indices_data:
+                    raise NotFoundError(404, 'index_not_found_exception', name)
+                del self.es.indices_data[name]
+                for members in self.es.aliases.values():
+                    members.discard(name)
+        return {'acknowledged': True}
+
+    def get_settings(self, index, **kwargs):
+        return {name: {'settings': {'index': dict(self.es.indices_data[name]['settings'])}}
+                for name in self.es._resolve(index)}
+
+    def put_settings(self, body, index, **kwargs):
+        settings = body.get('index', body)
+        for name in self.es._resolve(index):
+            current = self.es.indices_data[name]['settings']
+            current.update(settings)
+            # 与 ES 一样，设为 None 表示恢复默认值
+            for key in [key for key, value in current.items() if value is None]:
+                del current[key]
+        return {'acknowledged': True}
+
+    def refresh(self, index=None, **kwargs):
+        return {'_shards': {'failed': 0}}
+
+    def get_alias(self, index=None, name=None, **kwargs):
+        result = {}
+        for alias, members in self.es.aliases.items():
+            if name is not None and alias != name:
+                continue
+            for member in members:
+                result.setdefault(member, {'aliases': {}})['aliases'][alias] = {}
+        if name is not None and not result:
+            raise NotFoundError(404, 'alias_not_found', name)
+        return result
+
+    def update_aliases(self, body, **kwargs):
+        # 与 ES 一样，一次请求中的所有别名操作原子生效
+        with self.es.lock:
+            aliases = {alias: set(members) for alias, members in self.es.aliases.items()}
+            removed = []
+            for action in body['actions']:
+                (op, spec), = action.items()
+                if op == 'add':
+                    if spec['alias'] in self.es.indices_data and spec['alias'] not in removed:
+                        raise ValueError(f"别名 {spec['alias']} 与已有索引同名")
+                    aliases.setdefault(spec['alias'], set()).add(spec['index'])
+                elif op == 'remove':
+                    aliases.get(spec['alias'], set()).discard(spec['index'])
+                elif op == 'remove_index':
+                    removed.append(spec['index'])
+            for name in removed:
+                del self.es.indices_data[name]
+                for members in aliases.values():
+                    members.discard(name)
+            self.es.aliases = {alias: members for alias, members in aliases.items() if members}
+        return {'acknowledged': True}
+
+
+class LocalElasticsearch:
+    '''进程内的 Elasticsearch 替身，实现灌库与检索用到的那部分接口，用于离线测试与压测
+
+    reject_rate > 0 时随机以 429 拒绝部分文档，用来验证重试逻辑；latency 模拟每个 bulk 请求的网络往返（秒）
+    '''
+
+    def __init__(self, reject_rate=0.0, latency=0.0, seed=0):
+        self.transport = _Transport()
+        self.indices = _Indices(self)
+        self.indices_data = {}
+        self.aliases = {}
+        self.lock = threading.Lock()
+        self.reject_rate = reject_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.bulk_requests = 0
+        self.auto_ids = itertools.count()
+
+    def _resolve(self, name, missing_ok=False):
+        '''索引名或别名 -> 实际索引名列表'''
+        if name in self.indices_data:
+            return [name]
+        if name in self.aliases:
+            return sorted(self.aliases[name])
+        if missing_ok:
+            return []
+        raise NotFoundError(404, 'index_not_found_exception', name)
+
+    def bulk(self, body, index=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        lines = [line for line in body.split('\n') if line]
+        items = []
+        errors = False
+        with self.lock:
+            self.bulk_requests += 1
+            i = 0
+            while i < len(lines):
+                (op, meta), = json.loads(lines[i]).items()
+                i += 1
+                source = None
+                if op != 'delete':
+                    source = json.loads(lines[i])
+                    i += 1
+                name = meta.get('_index', index)
+                doc_id = meta.get('_id') or str(next(self.auto_ids))
+                if self.reject_rate and self.random.random() < self.reject_rate:
+                    errors = True
+                    items.append({op: {'_index': name, '_id': doc_id, 'status': 429,
+                                       'error': {'type': 'es_rejected_execution_exception'}}})
+                    continue
+                target, = self._resolve(name, missing_ok=True) or [None]
+                if target is None:
+                    # 与 ES 默认行为一致：写入不存在的索引时自动创建
+                    self.indices_data[name] = {'docs': {}, 'settings': {}, 'mappings': {}}
+                    target = name
+                docs = self.indices_data[target]['docs']
+                if op == 'delete':
+                    status = 200 if docs.pop(doc_id, None) is not None else 404
+                else:
+                    status = 200 if doc_id in docs else 201
+                    docs[doc_id] = source
+                items.append({op: {'_index': target, '_id': doc_id, 'status': status}})
+        return {'took': 0, 'errors': errors, 'items': items}
+
+    def count(self, index, **kwargs):
+        return {'count': sum(len(self.indices_data[name]['docs']) for name in self._resolve(index))}
+
+    def search(self, index, query=None, size=10, body=None, **kwargs):
+        '''只支持单字段 match 查询，按 BM25（k1=1.2, b=0.75）打分'''
+        query = query or (body or {}).get('query', {'match_all': {}})
+        with self.lock:
+            docs = [(name, doc_id, source) for name in self._resolve(index)
+                    for doc_id, source in self.indices_data[name]['docs'].items()]
+        if 'match' in query:
+            (field, text), = query['match'].items()
+            if isinstance(text, dict):
+                text = text['query']
+            hits = self._bm25(docs, field, str(text).lower().split())
+        else:
+            hits = [(1.0, doc) for doc in docs]
+        hits.sort(key=lambda hit: -hit[0])
+        return {'hits': {'total': {'value': len(hits), 'relation': 'eq'},
+                         'hits': [{'_index': name, '_id': doc_id, '_score': score, '_source': source}
+                                  for score, (name, doc_id, source) in hits[:size]]}}
+
+    @staticmethod
+    def _bm25(docs, field, terms, k1=1.2, b=0.75):
+        tokenized = [str(source.get(field, '')).lower().split() for _, _, source in docs]
+        if not tokenized:
+            return []
+        avgdl = sum(len(t) for t in tokenized) / len(tokenized) or 1
+        df = {term: sum(1 for tokens in tokenized if term in tokens) for term in set(terms)}
+        hits = []
+        for doc, tokens in zip(docs, tokenized):
+            score = 0.0
+            for term in terms:
+                tf = tokens.count(term)
+                if tf:
+                    idf = math.log(1 + (len(docs) - df[term] + 0.5) / (df[term] + 0.5))
+                    score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokens) / avgdl))
+            if score > 0:
+                hits.append((score, doc))
+        return hits
@@ -0,0 +1,195 @@
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from embedder import MAX_BATCH_TOKENS, MAX_INPUTS, RateLimiter, token_counter
+
+MAX_INPUT_TOKENS = 8191
+# chat 接口回答用的词表，每个词算一个 token
+ANSWER_WORDS = ('根据', '已知', '信息', '，', 'Llama', ' 2', ' 有', ' 7B', '、', '13B', ' 和', ' 70B', ' 三种',
+                '参数', '规模', '。')
+
+
+def mock_vector(text, dimensions):
+    '''按文本内容生成确定的单位向量'''
+    seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+    vec = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def mock_answer(messages, count):
+    '''按 messages 内容生成确定的回答，返回 count 个片段'''
+    text = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+    words = np.random.default_rng(seed).integers(0, len(ANSWER_WORDS), count)
+    return [ANSWER_WORDS[i] for i in words]
+
+
+class MockOpenAI:
+    '''本地的 OpenAI 兼容接口（/v1/embeddings 与 /v1/chat/completions），用于离线压测
+
+    rpm / tpm 为每分钟请求数与 token 数上限，超出时返回 429；latency 为每个请求的固定耗时（chat 接口即首个 token
+    的耗时），per_token 为 embedding 每个输入 token 额外的耗时，token_latency 为 chat 回答每个 token 的生成耗时（秒），
+    answer_tokens 为 chat 回答的默认 token 数（请求给出 max_tokens 时按请求）。用法：
+        with MockOpenAI(tpm=1000000) as mock:
+            client = OpenAI(base_url=mock.base_url, api_key='mock')
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0, rpm=None, tpm=None, latency=0.05, per_token=0.0,
+                 dimensions=1536, burst=2.0, token_latency=0.02, answer_tokens=64):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.limiter = RateLimiter(rpm, tpm, burst=burst) if rpm or tpm else None
+        self.latency = latency
+        self.per_token = per_token
+        self.dimensions = dimensions
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.count_tokens = token_counter()
+        self.stats = {'requests': 0, 'tokens': 0, 'rate_limited': 0, 'bad_requests': 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def embeddings(self, body):
+        '''返回 (状态码, 响应 JSON)'''
+        inputs = body['input']
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        counts = [self.count_tokens(text) for text in inputs]
+        tokens = sum(counts)
+        if len(inputs) > MAX_INPUTS or tokens > MAX_BATCH_TOKENS or max(counts, default=0) > MAX_INPUT_TOKENS:
+            self._count(bad_requests=1)
+            return 400, {'error': {'message': 'Too many inputs or tokens.', 'type': 'invalid_request_error'}}
+        if self.limiter is not None and not self.limiter.try_acquire(tokens):
+            self._count(rate_limited=1)
+            return 429, {'error': {'message': 'Rate limit reached.', 'type': 'requests',
+                                   'code': 'rate_limit_exceeded'}}
+        time.sleep(self.latency + self.per_token * tokens)
+        dimensions = body.get('dimensions') or self.dimensions
+        data = []
+        for i, text in enumerate(inputs):
+            vec = mock_vector(text, dimensions)
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vec.tobytes()).decode('ascii')
+            else:
+                embedding = vec.tolist()
+            data.append({'object': 'embedding', 'index': i, 'embedding': embedding})
+        self._count(requests=1, tokens=tokens)
+        return 200, {'object': 'list', 'data': data, 'model': body['model'],
+                     'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}}
+
+    def chat_completions(self, body):
+        '''返回 (状态码, 响应 JSON)；stream 请求返回 (200, 回答片段列表)，由 Handler 逐个以 SSE 发送'''
+        prompt_tokens = sum(self.count_tokens(str(m.get('content') or '')) for m in body['messages'])
+        if self.limiter is not None and not self.limiter.try_acquire(prompt_tokens):
+            self._count(rate_limited=1)
+            return 429, {'error': {'message': 'Rate limit reached.', 'type': 'requests',
+                                   'code': 'rate_limit_exceeded'}}
+        pieces = mock_answer(body['messages'], body.get('max_tokens') or self.answer_tokens)
+        self._count(requests=1, tokens=prompt_tokens + len(pieces))
+        if body.get('stream'):
+            return 200, pieces
+        time.sleep(self.latency + self.token_latency * len(pieces))
+        return 200, {'id': 'chatcmpl-mock', 'object': 'chat.completion', 'created': int(time.time()),
+                     'model': body['model'],
+                     'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(pieces)},
+                                  'finish_reason': 'stop'}],
+                     'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(pieces),
+                               'total_tokens': prompt_tokens + len(pieces)}}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if self.path.rstrip('/').endswith('/embeddings'):
+                    status, payload = mock.embeddings(body)
+                elif self.path.rstrip('/').endswith('/chat/completions'):
+                    status, payload = mock.chat_completions(body)
+                    if isinstance(payload, list):
+                        return self._stream(body['model'], payload)
+                else:
+                    status, payload = 404, {'error': {'message': f'{self.path} not found'}}
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model, pieces):
+                '''按 OpenAI 的格式逐个 token 发送 chat.completion.chunk 事件，最后发送 [DONE]'''
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                time.sleep(mock.latency)
+                deltas = [{'role': 'assistant', 'content': ''}] + [{'content': p} for p in pieces] + [{}]
+                for i, delta in enumerate(deltas):
+                    if 1 < i < len(deltas) - 1:
+                        time.sleep(mock.token_latency)
+                    chunk = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                             'model': model, 'choices': [{'index': 0, 'delta': delta,
+                                                          'finish_reason': None if delta else 'stop'}]}
+                    self.wfile.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+                    self.wfile.flush()
+                self.wfile.write(b'data: [DONE]\n\n')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='启动本地的 OpenAI 兼容 mock 接口')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rpm', type=int)
+    parser.add_argument('--tpm', type=int)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--token-latency', type=float, default=0.02, help='chat 回答每个 token 的耗时（秒）')
+    args = parser.parse_args(argv)
+    mock = MockOpenAI(port=args.port, rpm=args.rpm, tpm=args.tpm, latency=args.latency,
+                      token_latency=args.token_latency)
+    print(f'OPENAI_BASE_URL={mock.base_url}')
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+from pypdf import PdfReader
+
+# 连成一串的英文单词（pypdf 丢失空格时的典型输出，与 langChain/01.py 中 preprocess 的阈值一致）
+RUN_TOGETHER = re.compile(r'[A-Za-z]{20,}')
+
+
+def _iter_pages_pdfminer(filename, page_numbers=None):
+    '''pdfminer 版面分析：慢，但多栏排版、空格还原都更可靠'''
+    maxpages = 0
+    pages = None
+    if page_numbers is not None:
+        # 范围外的页在版面分析之前就被跳过，解析到最后一个指定页即停止
+        page_numbers = set(i for i in page_numbers if i >= 0)
+        if not page_numbers:
+            return
+        maxpages = max(page_numbers) + 1
+        pages = sorted(page_numbers)
+    for i, page_layout in enumerate(extract_pages(filename, page_numbers=page_numbers, maxpages=maxpages)):
+        lines = []
+        for element in page_layout:
+            if isinstance(element, LTTextContainer):
+                lines.extend(element.get_text().split('\n'))
+        yield (i if pages is None else pages[i]), lines
+
+
+def looks_degraded(text, max_ratio=0.01):
+    '''判断快速抽取的结果是否退化：没有文字，或连写长词占比过高'''
+    tokens = text.split()
+    if not tokens:
+        return True
+    return len(RUN_TOGETHER.findall(text)) / len(tokens) > max_ratio
+
+
+def _iter_pages_pypdf(filename, page_numbers=None, fallback=False):
+    '''pypdf 直接抽取文字流：快，适合单栏排版；fallback=True 时退化的页改用 pdfminer'''
+    reader = PdfReader(filename)
+    total = len(reader.pages)
+    pages = range(total) if page_numbers is None else sorted(set(i for i in page_numbers if 0 <= i < total))
+    for i in pages:
+        text = reader.pages[i].extract_text()
+        if fallback and looks_degraded(text):
+            yield from _iter_pages_pdfminer(filename, [i])
+            continue
+        # 与 pdfminer 一样，页尾视为段落结束
+        yield i, text.split('\n') + ['']
+
+
+def _iter_pages_auto(filename, page_numbers=None):
+    return _iter_pages_pypdf(filename, page_numbers, fallback=True)
+
+
+# 可插拔的抽取后端：名称 -> fn(filename, page_numbers) 按页码顺序产出 (页码, 行列表)
+BACKENDS = {
+    'pdfminer': _iter_pages_pdfminer,
+    'pypdf': _iter_pages_pypdf,
+    'auto': _iter_pages_auto,
+}
+
+
+def iter_page_lines(filename, page_numbers=None, backend='pdfminer'):
+    '''一次解析指定的页（只打开一次文件），按页码顺序产出 (页码, 该页的行列表)'''
+    return BACKENDS[backend](filename, page_numbers)
+
+
+def iter_lines(filename, page_numbers=None, backend='pdfminer'):
+    '''逐页解析 PDF，按行产出文字（生成器，不保留整篇文本）'''
+    for _, lines in iter_page_lines(filename, page_numbers, backend):
+        yield from lines
+
+
+def count_pages(filename):
+    '''读取 PDF 总页数（只解析页目录，不做版面分析）'''
+    with open(filename, 'rb') as fp:
+        doc = PDFDocument(PDFParser(fp))
+        return resolve1(doc.catalog['Pages'])['Count']
+
+
+def _extract_shard_lines(filename, pages, backend):
+    '''子进程任务：只对分片内的页做版面分析，返回按顺序排列的行'''
+    return list(iter_lines(filename, pages, backend))
+
+
+def iter_lines_parallel(filename, page_numbers=None, workers=4, pages_per_shard=8, backend='pdfminer'):
+    '''多进程按页范围分片解析 PDF，按页码顺序产出行
+
+    分片只产出行、不拼段落，跨分片的段落由下游 iter_paragraphs 统一拼接，
+    因此结果与单进程 iter_lines 完全一致
+    '''
+    total = count_pages(filename)
+    if page_numbers is None:
+        pages = list(range(total))
+    else:
+        pages = sorted(set(i for i in page_numbers if 0 <= i < total))
+    shards = [pages[i:i+pages_per_shard] for i in range(0, len(pages), pages_per_shard)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map 按提交顺序返回结果，保证页码顺序
+        for lines in executor.map(_extract_shard_lines, [filename]*len(shards), shards, [backend]*len(shards)):
+            yield from lines
+
+
+def _line_part(text):
+    '''行尾的连字符表示单词跨行，去掉连字符直接拼接；其余的行前面补一个空格'''
+    return (' '+text) if not text.endswith('-') else text.strip('-')
+
+
+def iter_paragraphs(lines, min_line_length=1):
+    '''按空行分隔，将行流重新组织成段落（生成器）'''
+    # 用列表收集片段，段落结束时一次性拼接，避免反复复制字符串
+    buffer = []
+    for text in lines:
+        if len(text) >= min_line_length:
+            part = _line_part(text)
+            if part:
+                buffer.append(part)
+        elif buffer:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def iter_page_paragraphs(pages, min_line_length=1):
+    '''pages 为 iter_page_lines 产出的 (页码, 行列表)，按 (段落开始的页码, 段落) 产出
+
+    段落的拼接与 iter_paragraphs 相同，跨页的段落不在页尾截断，而是归入开始的那一页
+    '''
+    buffer, start = [], None
+    for page_no, lines in pages:
+        for text in lines:
+            if len(text) >= min_line_length:
+                part = _line_part(text)
+                if part:
+                    if not buffer:
+                        start = page_no
+                    buffer.append(part)
+            elif buffer:
+                yield start, ''.join(buffer)
+                buffer = []
+    if buffer:
+        yield start, ''.join(buffer)
+
+
+def _write_through(cache, key, paragraphs, meta):
+    '''边产出段落边收集，全部产出后写入缓存'''
+    collected = []
+    for para in paragraphs:
+        collected.append(para)
+        yield para
+    cache.put(key, collected, meta=meta)
+
+
+def extract_text_from_pdf(filename, page_numbers=None, min_line_length=1, stream=False, workers=1, cache=None,
+                          backend='pdfminer'):
+    '''从 PDF 文件中（按指定页码）提取文字
+
+    backend 选择抽取后端：'pdfminer'（默认）、'pypdf'（快速）、'auto'（pypdf，退化的页回退到 pdfminer）
+
+    stream=True 时返回生成器，边解析页面边产出段落，内存占用与文档大小无关
+    workers>1 时用多进程按页分片解析（脚本需放在 if __name__ == '__main__': 下运行）
+    cache 传入 extract_cache.ExtractCache 时，同一文件、同样参数的结果直接从磁盘读取
+    '''
+    if cache is not None:
+        params = {
+            'kind': 'paragraphs',
+            'page_numbers': sorted(set(page_numbers)) if page_numbers is not None else None,
+            'min_line_length': min_line_length,
+            'backend': backend,
+        }
+        key = cache.key_for_file(filename, **params)
+        entry = cache.get(key)
+        if entry is not None:
+            return iter(entry.texts) if stream else entry.texts
+    if workers > 1:
+        lines = iter_lines_parallel(filename, page_numbers, workers, backend=backend)
+    else:
+        lines = iter_lines(filename, page_numbers, backend)
+    paragraphs = iter_paragraphs(lines, min_line_length)
+    if cache is not None:
+        paragraphs = _write_through(cache, key, paragraphs, dict(params, source=os.path.basename(filename)))
+    return paragraphs if stream else list(paragraphs)
@@ -0,0 +1,164 @@
+import numpy as np
+
+from similarity import METRICS, normalize, rescore as exact_rescore, top_k
+
+MODES = ('float32', 'float16', 'int8', 'pq')
+# 解码时一块最多这么多个元素，避免把整个压缩矩阵一次性转回 float32
+BLOCK_ELEMENTS = 1 << 22
+
+
+class QuantizedIndex:
+    '''压缩存储的向量索引，查询向量保持 float32，直接与压缩码计算分数（非对称距离，ADC）
+
+    float16：每维 2 字节
+    int8：每维按 [最小值, 最大值] 线性量化到 0..255，各维有自己的 offset 与 scale，每维 1 字节
+    pq：乘积量化，向量切成 m 段，每段用 256 个中心的码本编码成 1 字节，每个向量 m 字节；
+        查询时先算出查询每一段与各中心的分数表，再按编码查表求和
+
+    full 为原始 float32 向量（可以是内存映射的数组，例如 embedding 缓存的视图），
+    给出时 search(..., rescore=n) 先用压缩码取前 n 个候选，再用原始向量精确重排。
+    '''
+
+    def __init__(self, vectors, mode='int8', metric='cosine', m=None, full=None, seed=0):
+        if mode not in MODES:
+            raise ValueError(f'mode 只能是 {MODES} 之一')
+        if metric not in METRICS:
+            raise ValueError(f'metric 只能是 {METRICS} 之一')
+        self.mode = mode
+        self.metric = metric
+        self.full = full
+        vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+        if metric == 'cosine':
+            vectors = normalize(vectors)
+        self.dim = vectors.shape[1]
+        if mode == 'float32':
+            self.codes = vectors
+        elif mode == 'float16':
+            self.codes = vectors.astype(np.float16)
+        elif mode == 'int8':
+            low, high = vectors.min(axis=0), vectors.max(axis=0)
+            self.offset = low
+            self.scale = np.where(high > low, (high - low) / 255, 1).astype(np.float32)
+            self.codes = np.rint((vectors - low) / self.scale).astype(np.uint8)
+        else:
+            self._train_pq(vectors, m or max(1, self.dim // 8), seed)
+        # l2 需要各向量（解码后）的 |x|^2
+        self.sq_norms = None
+        if metric == 'l2':
+            self.sq_norms = np.concatenate([np.einsum('ij,ij->i', block, block) for block in self._decoded()])
+
+    def _train_pq(self, vectors, m, seed, iterations=10, max_samples=256 * 32):
+        '''m 个子空间的 k-means 一起迭代，码本为 (m, ksub, dim // m)'''
+        if self.dim % m:
+            raise ValueError(f'维度 {self.dim} 不能被 m={m} 整除')
+        self.m, sub = m, self.dim // m
+        rng = np.random.default_rng(seed)
+        sample = vectors
+        if len(vectors) > max_samples:
+            sample = vectors[rng.choice(len(vectors), max_samples, replace=False)]
+        ksub = min(256, len(sample))
+        parts = sample.reshape(-1, sub)  # 第 i 行第 j 段位于 i * m + j
+        self.codebooks = sample[rng.choice(len(sample), ksub, replace=False)].reshape(ksub, m, sub).transpose(1, 0, 2)
+        for _ in range(iterations):
+            # 各段的簇编号错开 j * ksub 后一起 bincount 求和
+            flat = (self._pq_encode(sample).astype(np.int64) + np.arange(m) * ksub).ravel()
+            counts = np.bincount(flat, minlength=m * ksub)
+            sums = np.stack([np.bincount(flat, parts[:, d], minlength=m * ksub) for d in range(sub)], axis=1)
+            codebooks = (sums / np.maximum(counts, 1)[:, None]).astype(np.float32)
+            # 空簇重新随机取点
+            empty = np.flatnonzero(counts == 0)
+            codebooks[empty] = sample.reshape(len(sample), m, sub)[rng.integers(0, len(sample), len(empty)),
+                                                                   empty // ksub]
+            self.codebooks = codebooks.reshape(m, ksub, sub)
+        self.codes = self._pq_encode(vectors)
+
+    def _pq_encode(self, vectors):
+        '''每段取最近的中心：|x - c|^2 = |x|^2 - 2 x·c + |c|^2，|x|^2 对 argmin 无影响'''
+        m, ksub, sub = self.codebooks.shape
+        sq = (self.codebooks ** 2).sum(-1)
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        step = max(1, BLOCK_ELEMENTS // (ksub * m))
+        for begin in range(0, len(vectors), step):
+            block = vectors[begin:begin+step].reshape(-1, m, sub).transpose(1, 0, 2)
+            dist = sq[:, None, :] - 2 * np.matmul(block, self.codebooks.transpose(0, 2, 1))  # (m, n, ksub)
+            codes[begin:begin+step] = dist.argmin(axis=2).T
+        return codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def nbytes(self):
+        '''常驻内存的压缩数据大小（不含 full）'''
+        extra = {'int8': ('offset', 'scale'), 'pq': ('codebooks',)}.get(self.mode, ())
+        return self.codes.nbytes + sum(getattr(self, name).nbytes for name in extra)
+
+    def _blocks(self):
+        step = max(1, BLOCK_ELEMENTS // self.dim)
+        for begin in range(0, len(self.codes), step):
+            yield begin, self.codes[begin:begin+step]
+
+    def _decoded(self):
+        '''按块解码成 float32（只用于预先计算 |x|^2）'''
+        for _, codes in self._blocks():
+            if self.mode == 'int8':
+                yield codes * self.scale + self.offset
+            elif self.mode == 'pq':
+                yield self.codebooks[np.arange(self.m), codes].reshape(len(codes), self.dim)
+            else:
+                yield codes.astype(np.float32)
+
+    def _dots(self, queries):
+        '''查询 (Q, dim) 与全部压缩向量的内积 (Q, N)'''
+        out = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        if self.mode == 'pq':
+            # 分数表 (Q, m, ksub)：查询每一段与该段各中心的内积
+            tables = np.einsum('qjs,jks->qjk', queries.reshape(len(queries), self.m, -1), self.codebooks)
+            cols = np.arange(self.m)
+            for begin, codes in self._blocks():
+                out[:, begin:begin+len(codes)] = tables[:, cols, codes].sum(axis=2)
+        elif self.mode == 'int8':
+            # q·x = q·offset + (q * scale)·code
+            scaled, base = queries * self.scale, queries @ self.offset
+            for begin, codes in self._blocks():
+                out[:, begin:begin+len(codes)] = scaled @ codes.astype(np.float32).T + base[:, None]
+        else:
+            for begin, codes in self._blocks():
+                out[:, begin:begin+len(codes)] = queries @ codes.astype(np.float32, copy=False).T
+        return out
+
+    def _prepare(self, queries):
+        queries = np.ascontiguousarray(np.asarray(queries, dtype=np.float32))
+        single = queries.ndim == 1
+        queries = queries.reshape(1, -1) if single else queries
+        return (normalize(queries) if self.metric == 'cosine' else queries), single
+
+    def _similarity(self, queries, vectors_dots, sq_norms):
+        '''越大越相似；l2 时为负的平方距离'''
+        if self.metric != 'l2':
+            return vectors_dots
+        return 2 * vectors_dots - sq_norms - np.einsum('ij,ij->i', queries, queries)[:, None]
+
+    def _to_scores(self, similarity):
+        if self.metric == 'l2':
+            return np.sqrt(np.maximum(-similarity, 0))
+        return similarity
+
+    def scores(self, queries):
+        '''近似分数：单个查询 -> (N,)，多个 -> (Q, N)；l2 时为欧氏距离'''
+        queries, single = self._prepare(queries)
+        scores = self._to_scores(self._similarity(queries, self._dots(queries), self.sq_norms))
+        return scores[0] if single else scores
+
+    def search(self, queries, k=10, rescore=0):
+        '''返回 (下标, 分数)，按相似程度从高到低；rescore > k 时先取 rescore 个候选，再用 full 精确重排'''
+        queries, single = self._prepare(queries)
+        similarity = self._similarity(queries, self._dots(queries), self.sq_norms)
+        if rescore > k and self.full is not None:
+            cand, _ = top_k(similarity, rescore)
+            ids, scores = zip(*(exact_rescore(self.full, rows, query, k, self.metric)
+                                for query, rows in zip(queries, cand)))
+            ids, scores = np.stack(ids), np.stack(scores)
+        else:
+            ids, best = top_k(similarity, k)
+            scores = self._to_scores(best)
+        return (ids[0], scores[0]) if single else (ids, scores)
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    '''合并多余空白；检索前的分析（关键字提取、大小写）由调用方完成'''
+    return ' '.join(query.split())
+
+
+class QueryCache:
+    '''检索结果缓存：键为 (规范化后的查询, top_n, 语料版本)，LRU 与 TTL 两种淘汰
+
+    语料版本变化（灌库改变了语料）时旧版本的结果全部作废。返回的是缓存中的同一个对象，调用方不要修改。
+    '''
+
+    def __init__(self, maxsize=1024, ttl=600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl  # 秒；None 表示不过期
+        self.clock = clock
+        self.version = None
+        self.entries = OrderedDict()  # (query, top_n) -> (过期时刻, 结果)
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.counters['invalidations'] += 1
+            self.entries.clear()
+            self.version = version
+
+    def get(self, query, top_n, version=None):
+        '''命中返回 (True, 结果)，否则返回 (False, None)'''
+        key = (normalize_query(query), top_n)
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return True, value
+                del self.entries[key]
+                self.counters['expirations'] += 1
+            self.counters['misses'] += 1
+            return False, None
+
+    def put(self, query, top_n, value, version=None):
+        key = (normalize_query(query), top_n)
+        with self.lock:
+            self._check_version(version)
+            expires = None if self.ttl is None else self.clock() + self.ttl
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+        return value
+
+    def get_or_compute(self, query, top_n, compute, version=None):
+        '''缓存未命中时调用 compute() 检索并写入缓存'''
+        hit, value = self.get(query, top_n, version)
+        if hit:
+            return value
+        return self.put(query, top_n, compute(), version)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.counters['hits'] + self.counters['misses']
+        return dict(self.counters, size=len(self.entries),
+                    hit_rate=self.counters['hits'] / lookups if lookups else 0.0)
@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from similarity import normalize
+
+DEFAULT_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', os.path.expanduser('~/.cache/chat-demo/responses.sqlite3'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,   -- 精确层的键：(模型, messages, temperature, tools, 其他参数) 的 sha256
+    model TEXT NOT NULL,
+    context TEXT,           -- 检索资料的 sha256
+    scope TEXT,             -- 语义层的范围：去掉用户问题后的请求（模板、资料、temperature、tools、其他参数）的 sha256
+    query TEXT,
+    embedding BLOB,         -- 查询向量（float32，已归一化），没有时不参与语义层
+    answer TEXT NOT NULL,   -- JSON
+    seconds REAL NOT NULL,  -- 当初生成回答的耗时
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+'''
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS answers_used ON answers (used);
+CREATE INDEX IF NOT EXISTS answers_scope ON answers (scope);
+'''
+# 把用户问题替换成占位符，同一模板下不同问题的请求得到相同的范围
+QUERY_PLACEHOLDER = '\0query\0'
+
+
+def _plain(value, query=None):
+    '''messages 转为可 JSON 序列化的形式：消息对象（例如 langchain 的 message）转为 (type, content)；
+    给出 query 时把其中的用户问题替换为占位符'''
+    if isinstance(value, str):
+        return value.replace(query, QUERY_PLACEHOLDER) if query else value
+    if isinstance(value, (list, tuple)):
+        return [_plain(v, query) for v in value]
+    if isinstance(value, dict):
+        return {k: _plain(v, query) for k, v in value.items()}
+    if hasattr(value, 'type') and hasattr(value, 'content'):
+        return [value.type, _plain(value.content, query)]
+    return value
+
+
+def request_key(model, messages, temperature=0, tools=None, **params):
+    payload = json.dumps({'model': model, 'messages': _plain(messages), 'temperature': temperature, 'tools': tools,
+                          **params}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def semantic_scope(model, messages, query, context=None, temperature=0, tools=None, **params):
+    '''语义层的范围：除用户问题以外请求的全部内容，只有范围相同的回答才能按问题相似度复用'''
+    payload = json.dumps({'model': model, 'messages': _plain(messages, query), 'context': context,
+                          'temperature': temperature, 'tools': tools, **params},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def context_digest(context):
+    if context is None:
+        return None
+    if not isinstance(context, str):
+        context = json.dumps(context, ensure_ascii=False, default=str)
+    return hashlib.sha256(context.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    '''get_completion 前面的两级回答缓存，持久化在 sqlite 中
+
+    精确层：键为 (模型, messages, temperature, tools, 其他参数)，只缓存 temperature <= max_temperature 的请求
+    （temperature 为 0 时相同输入得到相同输出，随机采样的回答不缓存）。
+    语义层（给出 embed(text) -> 向量 时启用）：除用户问题以外请求完全相同（模板、检索资料、temperature、tools、
+    其他参数，见 semantic_scope），且新问题与已缓存问题的余弦相似度 >= threshold 时复用回答。
+    条目超过 max_entries 时按最近最少使用淘汰，超过 ttl 秒的条目作废。回答需要能 JSON 序列化（例如 message.content）。
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=10000, ttl=None, embed=None, threshold=0.95,
+                 max_temperature=0.0, clock=time.time):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(answers)')}
+        if 'scope' not in columns:
+            # 旧版本的缓存文件：原有条目没有范围，不参与语义层
+            self.db.execute('ALTER TABLE answers ADD COLUMN scope TEXT')
+        self.db.executescript(INDEXES)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.threshold = threshold
+        self.max_temperature = max_temperature
+        self.clock = clock
+        self.lock = threading.RLock()
+        self._vectors = {}  # 范围 -> (键列表, 归一化的查询向量矩阵)，语义层用，按需从库中加载
+        self.stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'uncacheable': 0,
+                      'evictions': 0, 'expirations': 0, 'seconds_saved': 0.0}
+
+    def hit_rate(self):
+        hits = self.stats['exact_hits'] + self.stats['semantic_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+    # ---- 查找 ----
+
+    def _expired(self, created):
+        return self.ttl is not None and created + self.ttl <= self.clock()
+
+    def _fetch(self, key):
+        row = self.db.execute('SELECT answer, seconds, created FROM answers WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        answer, seconds, created = row
+        if self._expired(created):
+            self._delete([key])
+            self.stats['expirations'] += 1
+            return None
+        self.db.execute('UPDATE answers SET used = ?, hits = hits + 1 WHERE key = ?', (self.clock(), key))
+        self.db.commit()
+        return json.loads(answer), seconds
+
+    def _semantic_index(self, scope):
+        if scope not in self._vectors:
+            rows = self.db.execute('SELECT key, embedding FROM answers WHERE scope = ? AND embedding IS NOT NULL',
+                                   (scope,)).fetchall()
+            keys = [key for key, _ in rows]
+            matrix = (np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows]) if rows
+                      else np.empty((0, 0), dtype=np.float32))
+            self._vectors[scope] = (keys, matrix)
+        return self._vectors[scope]
+
+    def _semantic_lookup(self, scope, vector):
+        keys, matrix = self._semantic_index(scope)
+        if not keys or matrix.shape[1] != len(vector):
+            return None
+        scores = matrix @ vector
+        for i in np.argsort(-scores):
+            if scores[i] < self.threshold:
+                break
+            found = self._fetch(keys[i])
+            if found is not None:
+                return found
+        return None
+
+    # ---- 写入与淘汰 ----
+
+    def _delete(self, keys):
+        self.db.executemany('DELETE FROM answers WHERE key = ?', [(k,) for k in keys])
+        self.db.commit()
+        self._vectors.clear()
+
+    def _put(self, key, model, context, scope, query, vector, answer, seconds):
+        now = self.clock()
+        self.db.execute('INSERT OR REPLACE INTO answers (key, model, context, scope, query, embedding, answer, '
+                        'seconds, created, used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (key, model, context, scope, query, None if vector is None else vector.tobytes(),
+                         json.dumps(answer, ensure_ascii=False), seconds, now, now))
+        self.db.commit()
+        self._vectors.pop(scope, None)
+        count = self.db.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+        if count > self.max_entries:
+            old = self.db.execute('SELECT key FROM answers ORDER BY used LIMIT ?',
+                                  (count - self.max_entries,)).fetchall()
+            self._delete([k for k, in old])
+            self.stats['evictions'] += len(old)
+
+    def lookup(self, model, messages, temperature=0, tools=None, query=None, context=None, **params):
+        '''查缓存，返回 (是否命中, 回答, 凭据)
+
+        未命中时生成回答后调用 store(凭据, 回答, 耗时) 写入；不可缓存的请求凭据为 None
+        '''
+        if temperature > self.max_temperature:
+            self.stats['uncacheable'] += 1
+            return False, None, None
+        start = time.perf_counter()
+        key = request_key(model, messages, temperature, tools, **params)
+        context = context_digest(context)
+        scope = semantic_scope(model, messages, query, context, temperature, tools, **params) if query else None
+        with self.lock:
+            found = self._fetch(key)
+            if found is not None:
+                self.stats['exact_hits'] += 1
+                return self._hit(found, start)
+        vector = None
+        if self.embed is not None and query:
+            # embedding 可能是一次网络请求，不占着锁，其他调用方的查找不必排队
+            vector = normalize(np.asarray(self.embed(query), dtype=np.float32))
+            with self.lock:
+                found = self._semantic_lookup(scope, vector)
+                if found is not None:
+                    self.stats['semantic_hits'] += 1
+                    return self._hit(found, start)
+        with self.lock:
+            self.stats['misses'] += 1
+        return False, None, (key, model, context, scope, query, vector)
+
+    def _hit(self, found, start):
+        answer, seconds = found
+        self.stats['seconds_saved'] += max(seconds - (time.perf_counter() - start), 0.0)
+        return True, answer, None
+
+    def store(self, entry, answer, seconds):
+        if entry is None:
+            return
+        with self.lock:
+            self._put(*entry, answer, seconds)
+
+    def get_or_create(self, create, model, messages, temperature=0, tools=None, query=None, context=None,
+                      **params):
+        '''命中缓存时直接返回回答，否则调用 create() 生成并写入缓存
+
+        query / context 为用户问题与检索到的资料，给出时启用语义层
+        '''
+        hit, answer, entry = self.lookup(model, messages, temperature, tools, query, context, **params)
+        if hit:
+            return answer
+        start = time.perf_counter()
+        answer = create()
+        self.store(entry, answer, time.perf_counter() - start)
+        return answer
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+
+    def purge(self):
+        with self.lock:
+            self.db.execute('DELETE FROM answers')
+            self.db.commit()
+            self._vectors.clear()
+
+    def close(self):
+        self.db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='查看与清理回答缓存')
+    parser.add_argument('--path', default=DEFAULT_CACHE_PATH, help='缓存文件')
+    parser.add_argument('command', choices=['list', 'stats', 'purge'])
+    args = parser.parse_args(argv)
+
+    cache = ResponseCache(args.path)
+    if args.command == 'list':
+        rows = cache.db.execute('SELECT key, model, query, hits, seconds, used FROM answers ORDER BY used DESC')
+        for key, model, query, hits, seconds, used in rows:
+            used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(used))
+            print(f'{key[:16]}  {model:<20} 命中 {hits:>4} 次  生成 {seconds:6.2f} 秒  {used}  {query or ""}')
+    elif args.command == 'stats':
+        count, hits, seconds = cache.db.execute('SELECT COUNT(*), SUM(hits), SUM(hits * seconds) FROM answers').fetchone()
+        print(f'{count} 条，累计命中 {hits or 0} 次，约节省 {seconds or 0:.1f} 秒（{cache.path}）')
+    else:
+        n = len(cache)
+        cache.purge()
+        print(f'已删除 {n} 条')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import numpy as np
+
+METRICS = ('cosine', 'dot', 'l2')
+# 一次打分的分数矩阵最多这么多个元素（float32 约 256MB），查询更多时分批
+MAX_SCORE_ELEMENTS = 1 << 26
+
+
+def _as_matrix(vectors):
+    return np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+
+
+def normalize(vectors):
+    '''按行归一化为单位向量（零向量保持为零）'''
+    vectors = _as_matrix(vectors)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def top_k(scores, k, largest=True):
+    '''按行取前 k 个：argpartition 选出 k 个再只对这 k 个排序，返回 (下标, 分数)'''
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0), dtype=np.intp)
+        return empty, scores[:, :0]
+    keyed = -scores if largest else scores
+    if k < scores.shape[1]:
+        part = np.argpartition(keyed, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.take_along_axis(keyed, part, axis=1).argsort(axis=1, kind='stable')
+    ids = np.take_along_axis(part, order, axis=1)
+    return ids, np.take_along_axis(scores, ids, axis=1)
+
+
+class DenseIndex:
+    '''语料向量存成一个 float32 矩阵，批量查询用一次矩阵乘法打分
+
+    cosine：语料预先归一化，分数为余弦相似度（越大越相似）
+    dot：内积（越大越相似）
+    l2：欧氏距离（越小越相似），用 |q|^2 - 2 q·x + |x|^2 计算，语料的 |x|^2 预先算好
+    '''
+
+    def __init__(self, vectors, metric='cosine'):
+        if metric not in METRICS:
+            raise ValueError(f'metric 只能是 {METRICS} 之一')
+        self.metric = metric
+        self.matrix = normalize(vectors) if metric == 'cosine' else _as_matrix(vectors)
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix) if metric == 'l2' else None
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def _scores(self, queries):
+        if self.metric == 'cosine':
+            queries = normalize(queries)
+        scores = queries @ self.matrix.T
+        if self.metric == 'l2':
+            q_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+            scores = np.sqrt(np.maximum(q_norms - 2 * scores + self.sq_norms, 0))
+        return scores
+
+    def scores(self, queries):
+        '''返回全部分数：单个查询向量 -> (N,)，多个查询 -> (Q, N)'''
+        queries = _as_matrix(queries)
+        single = queries.ndim == 1
+        scores = self._scores(queries.reshape(1, -1) if single else queries)
+        return scores[0] if single else scores
+
+    def search(self, queries, k=10):
+        '''返回 (下标, 分数)，按相似程度从高到低；单个查询向量 -> (k,)，多个查询 -> (Q, k)'''
+        queries = _as_matrix(queries)
+        single = queries.ndim == 1
+        if single:
+            queries = queries.reshape(1, -1)
+        step = max(1, MAX_SCORE_ELEMENTS // max(len(self.matrix), 1))
+        ids, scores = [], []
+        for begin in range(0, len(queries), step):
+            i, s = top_k(self._scores(queries[begin:begin+step]), k, largest=self.metric != 'l2')
+            ids.append(i)
+            scores.append(s)
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        return (ids[0], scores[0]) if single else (ids, scores)
+
+
+def rescore(vectors, rows, query, k, metric='cosine'):
+    '''只取出候选行的原始向量精确打分，返回 (行号, 分数)；vectors 可以是内存映射的数组，只会读到这些行'''
+    rows = np.sort(rows)  # 按行号顺序读取，内存映射时更友好
+    pos, scores = DenseIndex(np.asarray(vectors[rows], dtype=np.float32), metric).search(query, k)
+    return rows[pos], scores
+
+
+class TwoStageIndex:
+    '''Matryoshka 两阶段检索：先在截取的低维矩阵上粗排，再对前 candidates 个候选用完整向量重排
+
+    text-embedding-3 系列的向量截取前 coarse_dim 维再归一化，与接口传 dimensions=coarse_dim 得到的向量等价，
+    所以只需要请求一次完整向量。常驻内存的只有低维矩阵；full 可以是内存映射的数组（如 embedding 缓存），
+    重排时只读取候选行。
+    '''
+
+    def __init__(self, full, coarse_dim=256, candidates=200, metric='cosine', coarse=None):
+        self.full = full if isinstance(full, np.ndarray) else np.stack(full)
+        self.metric = metric
+        self.candidates = candidates
+        # coarse 也可以直接给出（例如 get_embeddings(texts, model, dimensions=256) 的结果）
+        if coarse is None:
+            coarse = _as_matrix(self.full[:, :coarse_dim])
+        self.coarse = DenseIndex(coarse, metric)
+        self.coarse_dim = self.coarse.matrix.shape[1]
+
+    def __len__(self):
+        return len(self.coarse)
+
+    def search(self, queries, k=10, candidates=None):
+        '''返回 (下标, 分数)，分数为完整向量上的精确分数；单个查询 -> (k,)，多个 -> (Q, k)'''
+        queries = _as_matrix(queries)
+        single = queries.ndim == 1
+        if single:
+            queries = queries.reshape(1, -1)
+        candidates = max(candidates or self.candidates, k)
+        cand, _ = self.coarse.search(queries[:, :self.coarse_dim], candidates)
+        ids, scores = zip(*(rescore(self.full, rows, query, k, self.metric) for query, rows in zip(queries, cand)))
+        ids, scores = np.stack(ids), np.stack(scores)
+        return (ids[0], scores[0]) if single else (ids, scores)
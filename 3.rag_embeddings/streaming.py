@@ -0,0 +1,136 @@
+import asyncio
+import inspect
+import json
+import sys
+import threading
+import time
+
+from context_packer import cached_token_counter
+
+
+def openai_stream(client, **params):
+    '''AsyncOpenAI 的流式 chat completion：prompt 为字符串（作为一条 user 消息）或 messages 列表'''
+    async def generate(prompt, model, temperature):
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        stream = await client.chat.completions.create(model=model, messages=messages, temperature=temperature,
+                                                      stream=True, **params)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    return generate
+
+
+class StreamingRAG:
+    '''流式 RAG：检索 -> 打包资料、构建 prompt -> 流式生成，回答按片段逐个 yield
+
+    retrieve(query) 返回检索结果（普通函数在线程中执行，不阻塞事件循环；也可以是 async 函数）；
+    build_prompt(query, results) 返回 prompt 或 messages，资料的打包在其中完成；
+    generate(prompt, model, temperature) 为异步迭代器，逐段产出回答（见 openai_stream）。
+    prompt 一构建好就开始生成，stream() 是异步迭代器，CLI 中 async for 打印，HTTP 处理函数中经 sse() 返回。
+    给出 cache（ResponseCache）时命中的回答整段一次 yield（不计生成耗时与速度），未命中时生成完整的回答后写入。
+    last 为最近一次请求各阶段的耗时（秒）：检索、构建 prompt、首个 token（从收到问题算起）、生成，
+    以及回答的 token 数与生成速度（token/秒）；stats 为累计值。
+    '''
+
+    def __init__(self, retrieve, build_prompt, generate, model='gpt-3.5-turbo', temperature=0, cache=None):
+        self.retrieve = retrieve
+        self.build_prompt = build_prompt
+        self.generate = generate
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache
+        self.count = cached_token_counter(model)
+        self.last = None
+        self.stats = {'requests': 0, 'cache_hits': 0, 'errors': 0, 'tokens': 0, 'ttft': 0.0, 'total': 0.0}
+        self.lock = threading.Lock()
+
+    async def _retrieve(self, query):
+        if inspect.iscoroutinefunction(self.retrieve):
+            return await self.retrieve(query)
+        return await asyncio.to_thread(self.retrieve, query)
+
+    async def stream(self, query):
+        start = time.perf_counter()
+        report = {'retrieval': None, 'prompt': None, 'ttft': None, 'generation': None, 'total': None,
+                  'tokens': 0, 'tokens_per_second': None, 'cached': False, 'status': 'ok'}
+        pieces, first = [], None
+        try:
+            results = await self._retrieve(query)
+            retrieved = time.perf_counter()
+            report['retrieval'] = retrieved - start
+            prompt = self.build_prompt(query, results)
+            built = time.perf_counter()
+            report['prompt'] = built - retrieved
+
+            hit, entry = False, None
+            if self.cache is not None:
+                # 键与 get_completion 相同（字符串 prompt 作为一条 user 消息），两条路径共用缓存的回答；
+                # 语义层要为问题做 embedding，放到线程中
+                messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+                hit, answer, entry = await asyncio.to_thread(self.cache.lookup, self.model, messages,
+                                                             self.temperature, query=query, context=results)
+            if hit:
+                report['cached'] = True
+                generated = self._single(answer)
+            else:
+                generated = self.generate(prompt, self.model, self.temperature)
+            async for piece in generated:
+                if not piece:
+                    continue
+                if first is None:
+                    first = time.perf_counter()
+                    report['ttft'] = first - start
+                pieces.append(piece)
+                yield piece
+            if entry is not None:
+                self.cache.store(entry, ''.join(pieces), time.perf_counter() - built)
+        except (GeneratorExit, asyncio.CancelledError):
+            # 调用方中途停止读取（aclose），或所在的任务被取消（例如 HTTP 客户端断开时处理函数被取消）
+            report['status'] = 'cancelled'
+            raise
+        except Exception as e:
+            report['status'] = f'error: {e!r}'
+            raise
+        finally:
+            end = time.perf_counter()
+            report['total'] = end - start
+            report['tokens'] = self.count(''.join(pieces)) if pieces else 0
+            if first is not None and not report['cached']:
+                report['generation'] = end - first
+                report['tokens_per_second'] = report['tokens'] / max(end - first, 1e-9)
+            with self.lock:
+                self.last = report
+                self.stats['requests'] += 1
+                self.stats['cache_hits'] += report['cached']
+                self.stats['errors'] += report['status'].startswith('error')
+                self.stats['tokens'] += report['tokens']
+                self.stats['ttft'] += report['ttft'] or 0.0
+                self.stats['total'] += report['total']
+
+    @staticmethod
+    async def _single(answer):
+        yield answer
+
+    async def answer(self, query):
+        '''不需要流式输出时：返回完整的回答'''
+        return ''.join([piece async for piece in self.stream(query)])
+
+
+async def print_stream(pieces, file=sys.stdout):
+    '''CLI 用：边生成边打印，返回完整的回答'''
+    text = []
+    async for piece in pieces:
+        print(piece, end='', file=file, flush=True)
+        text.append(piece)
+    print(file=file)
+    return ''.join(text)
+
+
+async def sse(pieces):
+    '''HTTP 用：转为 text/event-stream 的字节流，每个片段一个 data 事件，最后为 data: [DONE]
+
+    例如 aiohttp 中逐个 await response.write(event)，或直接作为 Starlette StreamingResponse 的内容
+    '''
+    async for piece in pieces:
+        yield f'data: {json.dumps({"content": piece}, ensure_ascii=False)}\n\n'.encode('utf-8')
+    yield b'data: [DONE]\n\n'
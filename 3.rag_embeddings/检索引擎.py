@@ -1,99 +1,87 @@
-import re
 import warnings
 
-from elasticsearch7 import Elasticsearch, helpers
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
-from nltk.tokenize import word_tokenize
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer
+from elasticsearch7 import Elasticsearch
+
+from bm25 import BM25Index
+from es_index import KEYWORDS_MAPPING, ElasticsearchSink, rebuild_index
+from extract_cache import ExtractCache
+from ingest import IncrementalIngestor, pdf_paragraphs
+from keywords import to_keywords, to_keywords_batch  # 停用词表与词干提取器只加载一次，词干结果带缓存
+from pdf_loader import extract_text_from_pdf
+from query_cache import QueryCache
 
 warnings.simplefilter("ignore")  # 屏蔽 ES 的一些Warnings
 
-def extract_text_from_pdf(filename, page_numbers=None, min_line_length=1):
-    '''从 PDF 文件中（按指定页码）提取文字'''
-    paragraphs = []
-    buffer = ''
-    full_text = ''
-    # 提取全部文本
-    for i, page_layout in enumerate(extract_pages(filename)):
-        # 如果指定了页码范围，跳过范围外的页
-        if page_numbers is not None and i not in page_numbers:
-            continue
-        for element in page_layout:
-            if isinstance(element, LTTextContainer):
-                full_text += element.get_text() + '\n'
-    # 按空行分隔，将文本重新组织成段落
-    lines = full_text.split('\n')
-    for text in lines:
-        if len(text) >= min_line_length:
-            buffer += (' '+text) if not text.endswith('-') else text.strip('-')
-        elif buffer:
-            paragraphs.append(buffer)
-            buffer = ''
-    if buffer:
-        paragraphs.append(buffer)
-    return paragraphs
-
-paragraphs = extract_text_from_pdf("llama2.pdf", min_line_length=10)
+# 解析结果按文件内容缓存在磁盘上，重复运行不再重新解析 PDF
+paragraphs = extract_text_from_pdf("llama2.pdf", min_line_length=10, cache=ExtractCache())
 for para in paragraphs:
     print(para+"\n")
 
-def to_keywords(input_string):
-    '''（英文）文本只保留关键字'''
-    # 使用正则表达式替换所有非字母数字的字符为空格
-    no_symbols = re.sub(r'[^a-zA-Z0-9\s]', ' ', input_string)
-    word_tokens = word_tokenize(no_symbols)
-    # 加载停用词表
-    stop_words = set(stopwords.words('english'))
-    ps = PorterStemmer()
-    # 去停用词，取词根
-    filtered_sentence = [ps.stem(w)
-                         for w in word_tokens if not w.lower() in stop_words]
-    return ' '.join(filtered_sentence)
-
 # 1. 创建Elasticsearch连接
 es = Elasticsearch(
     hosts=['http://117.50.198.53:9200'],  # 服务地址与端口
     http_auth=("elastic", "FKaB1Jpz0Rlw0l6G"),  # 用户名，密码
 )
 
-# 2. 定义索引名称
+# 2. 定义索引名称：查询与增量写入都通过别名，实际索引带版本号
 index_name = "teacher_demo_index_tmp"
 
-# 3. 如果索引已存在，删除它（仅供演示，实际应用时不需要这步）
-if es.indices.exists(index=index_name):
-    es.indices.delete(index=index_name)
+def load_version(new_index):
+    '''灌满一个新版本索引（灌库设置下进行），同时重建增量清单'''
+    builder = IncrementalIngestor(
+        index_name,
+        ElasticsearchSink(es, new_index, analyze=to_keywords_batch),
+        params={"min_line_length": 10},
+    )
+    builder.forget()
+    return builder.ingest_pdf("llama2.pdf", pdf_paragraphs(min_line_length=10))
 
-# 4. 创建索引
-es.indices.create(index=index_name)
+# 3. 别名不存在时（或需要全量重建时）不再先删后建：后台建新版本索引，灌满后原子切换别名，
+#    整个过程中查询一直由旧索引服务
+# es.indices.delete(index=index_name)
+# es.indices.create(index=index_name)
+if not es.indices.exists(index=index_name):
+    print(rebuild_index(es, index_name, load_version, body=KEYWORDS_MAPPING, keep=1))
 
-# 5. 灌库指令
-actions = [
-    {
-        "_index": index_name,
-        "_source": {
-            "keywords": to_keywords(para),
-            "text": para
-        }
-    }
-    for para in paragraphs
-]
+# 4. 增量灌库器：记录每页与每个段落的指纹，sink 负责按批提取关键字并并发写入别名指向的索引
+sink = ElasticsearchSink(es, index_name, analyze=to_keywords_batch, chunk_size=500, max_inflight=4)
+ingestor = IncrementalIngestor(index_name, sink, params={"min_line_length": 10})
 
-# 6. 文本灌库
-helpers.bulk(es, actions)
+# 5. 增量灌库：文件未变直接跳过；只抽取修改过的页，只为新段落提取关键字，删除已消失的段落；
+#    新段落边抽取、边按批提取关键字、边并发写入
+print(ingestor.ingest_pdf("llama2.pdf", pdf_paragraphs(min_line_length=10)))
+print(sink.stats)  # 写入统计：文档数、失败数、docs_per_sec；文件未变时为 None
+
+# 检索结果缓存：同一问题（关键字相同）直接返回，灌库改变语料后自动作废
+query_cache = QueryCache(maxsize=1024, ttl=600)
 
 def search(query_string, top_n=3):
-    # ES 的查询语言
-    search_query = {
-        "match": {
-            "keywords": to_keywords(query_string)
+    keywords = to_keywords(query_string)
+
+    def es_search():
+        # ES 的查询语言
+        search_query = {
+            "match": {
+                "keywords": keywords
+            }
         }
-    }
-    res = es.search(index=index_name, query=search_query, size=top_n)
-    return [hit["_source"]["text"] for hit in res["hits"]["hits"]]
+        res = es.search(index=index_name, query=search_query, size=top_n)
+        return [hit["_source"]["text"] for hit in res["hits"]["hits"]]
+
+    return query_cache.get_or_compute(keywords, top_n, es_search, version=ingestor.corpus_version())
 
 results = search("how many parameters does llama 2 have?", 2)
 
 for r in results:
-    print(r+"\n")
\ No newline at end of file
+    print(r+"\n")
+
+search("How many parameters does Llama 2 have", 2)  # 关键字相同，命中缓存
+print(query_cache.stats())
+
+# 本地 BM25 倒排索引：与 ES 版 search() 用法相同，不需要集群，也没有网络往返
+local_index = BM25Index.build(paragraphs)
+local_index.save("llama2.bm25")
+local_index = BM25Index.load("llama2.bm25")  # 内存映射加载，不做反序列化
+
+for r in local_index.search("how many parameters does llama 2 have?", 2):
+    print(r+"\n")
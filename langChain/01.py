@@ -1,88 +1,216 @@
+import asyncio
+import functools
+import glob
+import hashlib
 import os
-import re, wordninja
 import openai
 from dotenv import load_dotenv, find_dotenv
 from langchain.chat_models import ChatOpenAI
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter  # 递归字符分割器
 from langchain.retrievers import TFIDFRetriever  # 最传统的关键字加权检索
 from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
+from langchain.schema import Document
+
+from chunk_index import (BackendEmbeddings, BM25Index, CachedEmbeddings, ChunkStore, ContextPacker, FaissSink,
+                         HybridRetriever, IncrementalIngestor, IVFStore, QueryCache, ResponseCache, StreamingRAG,
+                         chunk_id, get_backend, print_stream, to_cjk_keywords, to_cjk_keywords_batch)
+from pdf_reader import ExtractCache, load_and_split
+from text_preprocess import Preprocessor
 
 _ = load_dotenv(find_dotenv())  # 加载 .env 到环境变量
 
+# PDF 解析与切分结果的磁盘缓存（python ../3.rag_embeddings/extract_cache.py list 查看）
+cache = ExtractCache()
+
 # 配置 OpenAI 服务
 openai.api_key = os.getenv('OPENAI_API_KEY')  # 设置 OpenAI 的 key
 openai.api_base = os.getenv('OPENAI_API_BASE')  # 指定代理地址
 
 
-# 预处理字符全都连在一起的行
-def preprocess(text):
-    def split(line):
-        tokens = re.findall(r'\w+|[.,!?;%$-+=@#*/]', line)
-        return [
-            ' '.join(wordninja.split(token)) if token.isalnum() else token
-            for token in tokens
-        ]
+# 检索结果缓存：同一问题不再重复做 embedding 与向量检索，向量库内容变化后自动作废
+query_cache = QueryCache(maxsize=256, ttl=3600)
+
+# 回答缓存（持久化，python ../3.rag_embeddings/response_cache.py stats 查看）：temperature=0 时相同输入的回答相同
+response_cache = ResponseCache(embed=lambda text: get_embeddings().embed_query(text), threshold=0.95)
+
+# 资料的 token 预算（gpt-3.5-turbo 的上下文窗口还要留给问题与回答）
+context_packer = ContextPacker(max_tokens=2000, model="gpt-3.5-turbo")
+
+# 中文关键字索引：文本指纹 -> (BM25 索引, chunk 编号列表)，同一份文本只建一次
+keyword_indexes = {}
+
+# 已同步的向量库：(目录名, 文本指纹) -> (向量库, 增量灌库器)，同一份文本只灌库一次
+vector_stores = {}
 
-    lines = text.split('\n')
-    for i, line in enumerate(lines):
-        if len(max(line.split(' '), key=len)) >= 20:
-            lines[i] = ' '.join(split(line))
-    return ' '.join(lines)
+# 向量库：默认本地 IVF 近似检索（IVFStore），VECTOR_STORE=faiss 时用 FAISS（FaissSink），两者分别保存在各自的目录
+VECTOR_STORE = os.getenv("VECTOR_STORE", "ivf")
+VECTOR_INDEX = f"{VECTOR_STORE}_index"
 
+# 预处理字符全都连在一起的行（连写单词的拆分结果跨页缓存）
+preprocessor = Preprocessor()
 
-def read_pdf(path, start_page, end_page):
+
+def read_pdf(path, start_page, end_page, workers=1):
     """
     根据页数范围读取 PDF 文件并返回分页后的文本列表
     :param path: PDF 文件路径
     :param start_page: 开始页数
     :param end_page: 结束页数
+    :param workers: 解析 PDF 的进程数，大于 1 时按页范围多进程并行解析
     :return: 分割后的文本列表
     """
 
-    # 加载文件
-    loader = PyPDFLoader(path)
-    # 分割文件
-    pages = loader.load_and_split()
+    # 预处理结果按文件内容与页数范围缓存
+    key = cache.key_for_file(path, kind='read_pdf', start_page=start_page, end_page=end_page)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry.texts
+
+    # 只加载并分割指定范围内的页，范围外的页不解析（workers > 1 时多进程解析，结果与单进程一致；
+    # macOS/Windows 下脚本需放在 if __name__ == '__main__': 中运行）
+    pages = load_and_split(path, workers, cache, start=start_page - 1, end=end_page)
+
+    texts = preprocessor.process_batch([page.page_content for page in pages])
+    return cache.put(key, texts, meta={'kind': 'read_pdf', 'source': os.path.basename(path),
+                                       'start_page': start_page, 'end_page': end_page})
+
+
+@functools.lru_cache(maxsize=None)
+def get_embeddings():
+    """
+    向量模型（整个进程共用一个）：向量按 (模型, 文本 sha256) 缓存在本地内存映射文件中
+    EMBEDDING_BACKEND=local 时换成本地哈希 n-gram 向量化：离线可用、不需要 API key，用于压测灌库与检索
+    """
+    if os.getenv("EMBEDDING_BACKEND", "openai") == "openai":
+        return CachedEmbeddings(OpenAIEmbeddings())
+    return CachedEmbeddings(BackendEmbeddings(get_backend()))
+
 
-    # return [preprocess(page.page_content) for page in pages[start_page - 1:end_page]]
-    return [preprocess(page.page_content) for page in pages[start_page - 1:end_page]]
+def text_digest(stringList):
+    """文本列表的指纹，文本不变时索引不用重建"""
+    return hashlib.sha1("\0".join(stringList).encode("utf-8")).hexdigest()[:16]
 
 
-def get_relevant_documents(stringList, user_query):
+def get_vector_store(stringList, index_name=VECTOR_INDEX):
+    """
+    增量建库：向量库保存在本地，只对新增或修改过的页切分（按中英文句读），只为新 chunk 做 embedding，
+    删除已消失的 chunk；本地 IVF 近似检索只扫描最近的 nprobe 个倒排表，索引以内存映射方式加载
+    （VECTOR_STORE=faiss 时为 FAISS 精确检索）
+    :param stringList: 读取的文本列表
+    :param index_name: 向量库在本地保存的目录名，同时用作增量灌库清单的名称
+    :return: (向量库, 增量灌库器)
+    """
+    key = (index_name, text_digest(stringList))
+    if key not in vector_stores:
+        if VECTOR_STORE == "faiss":
+            sink = FaissSink(index_name, get_embeddings())
+        else:
+            sink = IVFStore(index_name, get_embeddings(), nprobe=8)
+        ingestor = IncrementalIngestor(index_name, sink, params={"chunk_size": 200, "chunk_overlap": 60})
+        if not len(sink):
+            ingestor.forget()
+        ingestor.ingest_texts("pages", stringList, split=lambda text: list(ChunkStore([text], 200, 60)))
+        sink.save()
+        vector_stores[key] = (sink, ingestor)
+    return vector_stores[key]
+
+
+def vector_search(sink, ingestor, index_name, user_query, top_n):
+    """只查询已建好的向量库，结果经检索缓存"""
+    return query_cache.get_or_compute(user_query, top_n, lambda: sink.similarity_search(user_query, top_n),
+                                      version=(index_name, ingestor.corpus_version()))
+
+
+def get_relevant_documents(stringList, user_query, index_name=VECTOR_INDEX, top_n=4):
     """
     根据用户的查询，返回相关的文档
     :param stringList: 读取的文本列表
     :param user_query: 用户的查询
+    :param index_name: 向量库在本地保存的目录名，同时用作增量灌库清单的名称
+    :param top_n: 返回的文档数
     :return: 相关的文档
     """
 
-    # 从文档中创建分割器
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=200,  # 每个 chunk 的长度
-        chunk_overlap=60,  # 因为有些词会被分割开，比如“中国”
-        length_function=len,  # 用于计算长度的函数
-        add_start_index=True,  # 是否在每个 chunk 前面加上索引
-    )
+    # 从文档中创建检索器（偏移量切分的 ChunkStore 可以直接当作文本序列使用）
+    # retriever = TFIDFRetriever.from_texts(ChunkStore(stringList, chunk_size=200, chunk_overlap=60))
+    # return retriever.get_relevant_documents(user_query)
 
-    # 取一个有信息量的章节
-    paragraphs = text_splitter.create_documents(stringList)
+    sink, ingestor = get_vector_store(stringList, index_name)
+    return vector_search(sink, ingestor, index_name, user_query, top_n)
 
-    # 从文档中创建检索器
-    # retriever = TFIDFRetriever.from_documents(paragraphs)
 
-    # Facebook 的开源向量检索引擎
-    embeddings = OpenAIEmbeddings()
-    db = FAISS.from_documents(paragraphs, embeddings)
+def get_keyword_index(stringList, index_name="keyword_index"):
+    """
+    中文关键字索引：与增量灌库相同的逐页切分，汉字按二元组切分建 BM25 倒排表，不需要调用 embedding 接口；
+    索引按文本指纹保存在本地（{index_name}-指纹.bm25），之后以内存映射方式加载，同一进程内只加载一次
+    :param stringList: 读取的文本列表
+    :param index_name: 索引文件名的前缀
+    :return: (BM25 索引, chunk 编号列表)
+    """
+    digest = text_digest(stringList)
+    if digest not in keyword_indexes:
+        path = f"{index_name}-{digest}.bm25"
+        if not os.path.exists(path):
+            chunks = [chunk for text in stringList for chunk in ChunkStore([text], 200, 60)]
+            BM25Index.build(chunks, to_cjk_keywords_batch, to_cjk_keywords).save(path)  # 原子写入
+            # 文本变化后旧指纹的索引不再使用
+            for old in glob.glob(f"{index_name}-*.bm25"):
+                if old != path:
+                    os.remove(old)
+        index = BM25Index.load(path, to_cjk_keywords)
+        keyword_indexes[digest] = (index, [chunk_id("pages", index.text(i)) for i in range(len(index))])
+    return keyword_indexes[digest]
+
+
+def get_keyword_documents(stringList, user_query, top_n=4):
+    """
+    中文关键字检索：索引只建一次（见 get_keyword_index），每次查询只查倒排表
+    :param stringList: 读取的文本列表
+    :param user_query: 用户的查询
+    :param top_n: 返回的文档数
+    :return: 相关的文档
+    """
+    index, ids = get_keyword_index(stringList)
+    return [Document(page_content=index.text(i), metadata={"chunk_id": ids[i]})
+            for i, _ in index.search_ids(user_query, top_n)]
 
-    # return retriever.get_relevant_documents(user_query)
-    return db.similarity_search(user_query)
+
+def get_hybrid_documents(stringList, user_query, index_name=VECTOR_INDEX, top_n=4):
+    """
+    混合检索：向量与中文关键字两路并发检索，按倒数排名融合（RRF），同一个 chunk 只保留一次；
+    每一路有自己的超时，慢的一路超时后只用另一路的结果
+    :param stringList: 读取的文本列表
+    :param user_query: 用户的查询
+    :param index_name: 向量库在本地保存的目录名
+    :param top_n: 返回的文档数
+    :return: 相关的文档
+    """
+    # 两路的索引都在计时之外建好（同一份文本只建一次），每一路只做查询：
+    # 超时的一路在后台跑完也只是读索引，不会写向量库与清单；两路用相同的逐页切分与 chunk 编号，可以按编号去重
+    keyword_index, ids = get_keyword_index(stringList)
+    sink, ingestor = get_vector_store(stringList, index_name)
+
+    def keyword_leg(query, n):
+        return [(ids[i], Document(page_content=keyword_index.text(i), metadata={"chunk_id": ids[i]}))
+                for i, _ in keyword_index.search_ids(query, n)]
+
+    def vector_leg(query, n):
+        return [(doc.metadata["chunk_id"], doc) for doc in vector_search(sink, ingestor, index_name, query, n)]
+
+    retriever = HybridRetriever({"keyword": keyword_leg, "vector": vector_leg},
+                                timeouts={"keyword": 1.0, "vector": 5.0})
+    try:
+        return retriever.search(user_query, top_n)
+    finally:
+        retriever.close()
 
 
 # 拼接文档列表
-def concat_docs_list(list):
+def concat_docs_list(list, packer=None):
+    # 给出 packer 时按 token 预算打包：合并切分时重叠的 chunk，按检索顺序装入，超出预算的丢弃
+    if packer is not None:
+        return packer.pack([item.page_content for item in list])
+
     result = ''
 
     for item in list:
@@ -112,30 +240,62 @@ def get_chat_response(information, query):
     llm = ChatOpenAI(temperature=0)
 
     # 生成问答
-    response = llm(
-        template.format_messages(
-            information=information,
-            query=query
-        )
+    # 回答缓存：相同的请求直接返回（与 get_streaming_rag 共用）；资料相同、问题的向量足够接近时复用已有回答
+    messages = template.format_messages(information=information, query=query)
+    return response_cache.get_or_create(
+        lambda: llm(messages).content,
+        llm.model_name, messages, temperature=llm.temperature,
+        query=query, context=information,
     )
 
-    return response.content
 
+# 流式生成：回答按片段逐个产出
+async def generate_chat_stream(messages, model, temperature):
+    llm = ChatOpenAI(model_name=model, temperature=temperature, streaming=True)
+    async for chunk in llm.astream(messages):
+        yield chunk.content
 
-# 读取 PDF 文件
-pdf_text = read_pdf("wg史 北大马会编.pdf", 1, 377)
 
-# 用户查询关键字
-user_query = "文化大革命发生了什么，真相是什么？积极影响有哪些？"
+# 流式问答：检索 -> 按 token 预算拼接文档、套用问答模板 -> 流式生成，首个 token 到达就可以输出
+def get_streaming_rag(stringList, retrieve=None, top_n=4):
+    """
+    返回 StreamingRAG：rag.stream(query) 为异步迭代器（CLI 中边生成边打印，HTTP 中经 sse() 返回），
+    rag.last 为检索、构建 prompt、首个 token、生成的耗时（秒）与 token/秒；回答经过 response_cache
+    :param stringList: 读取的文本列表
+    :param retrieve: 检索函数，默认 get_relevant_documents（向量），也可以是 get_keyword_documents、get_hybrid_documents
+    :param top_n: 检索的文档数
+    """
+    retrieve = retrieve or get_relevant_documents
+    return StreamingRAG(
+        lambda query: retrieve(stringList, query, top_n=top_n),
+        lambda query, docs: get_chat_template().format_messages(
+            information=concat_docs_list(docs, context_packer),
+            query=query
+        ),
+        generate_chat_stream,
+        model="gpt-3.5-turbo",
+        cache=response_cache,
+    )
 
-# 检索文档
-docs = get_relevant_documents(pdf_text, user_query)
 
-# 拼接文档
-doc_test = concat_docs_list(docs)
+# 读取 PDF 文件（多进程：read_pdf(..., workers=4)）
+pdf_text = read_pdf("wg史 北大马会编.pdf", 1, 377)
+# print(preprocessor.stats())  # 切词缓存命中率
 
-# print(doc_test, 'doc_test')
+# 用户查询关键字
+user_query = "文化大革命发生了什么，真相是什么？积极影响有哪些？"
 
-# 问答
-content = get_chat_response(doc_test, user_query)
-print(content)
+# 一次性返回：检索文档 -> 按 token 预算拼接 -> 问答
+# docs = get_relevant_documents(pdf_text, user_query)
+# content = get_chat_response(concat_docs_list(docs, context_packer), user_query)
+# print(content)
+
+# 流式问答：检索文档 -> 按 token 预算拼接 -> 流式生成，首个 token 到达就开始打印，不必等完整的回答
+rag = get_streaming_rag(pdf_text)
+# rag = get_streaming_rag(pdf_text, get_keyword_documents)  # 中文关键字检索（python ../3.rag_embeddings/bench_keywords.py 查看延迟与索引大小）
+# rag = get_streaming_rag(pdf_text, get_hybrid_documents)  # 向量 + 关键字混合检索（两路并发，倒数排名融合）
+content = asyncio.run(print_stream(rag.stream(user_query)))
+print(rag.last)  # 检索、构建 prompt、首个 token、生成的耗时（秒）与 token/秒
+# print(query_cache.stats())  # 检索缓存命中率
+# print(context_packer.last)  # 合并、丢弃的 chunk 数与节省的 token 数
+# print(response_cache.stats, response_cache.hit_rate())  # 回答缓存命中率与节省的时间
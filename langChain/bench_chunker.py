@@ -0,0 +1,53 @@
+import argparse
+import gc
+import logging
+import time
+import tracemalloc
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from chunk_index import ChunkStore
+from pdf_reader import load_pages
+
+BOOKS = ["wg史 北大马会编.pdf", "冯友兰《中国哲学史》.pdf"]
+
+
+def measure(build):
+    '''返回 (构建结果, 构建后仍占用的字节数, 峰值字节数, 秒)'''
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='对比 RecursiveCharacterTextSplitter 与偏移量切分的内存占用')
+    parser.add_argument('books', nargs='*', default=BOOKS)
+    parser.add_argument('--chunk-size', type=int, default=200)
+    parser.add_argument('--chunk-overlap', type=int, default=60)
+    args = parser.parse_args(argv)
+
+    logging.getLogger('pypdf').setLevel(logging.ERROR)
+    for book in args.books:
+        texts = [page.page_content for page in load_pages(book)]
+        text_chars = sum(len(t) for t in texts)
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, length_function=len, add_start_index=True)
+        docs, docs_mem, docs_peak, docs_sec = measure(lambda: splitter.create_documents(texts))
+        store, store_mem, store_peak, store_sec = measure(
+            lambda: ChunkStore(texts, args.chunk_size, args.chunk_overlap))
+        print(f'{book}: {len(texts)} 页，{text_chars} 字')
+        print(f'  RecursiveCharacterTextSplitter: {len(docs):6d} chunks  占用 {docs_mem/2**20:7.2f} MB'
+              f'  峰值 {docs_peak/2**20:7.2f} MB  {docs_sec:.2f}s')
+        print(f'  ChunkStore（偏移量）:           {len(store):6d} chunks  占用 {store_mem/2**20:7.2f} MB'
+              f'  峰值 {store_peak/2**20:7.2f} MB  {store_sec:.2f}s')
+        print(f'  内存降低 {1 - store_mem/docs_mem:.0%}')
+        del docs, store
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from pdf_reader import ExtractCache, load_and_split
 
 # import re, wordninja
 
@@ -20,8 +19,7 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 #     return ' '.join(lines)
 
 
-loader = PyPDFLoader("冯友兰《中国哲学史》.pdf")  # 加载文件
-pages = loader.load_and_split()  # 分割文件
+pages = load_and_split("冯友兰《中国哲学史》.pdf", cache=ExtractCache())  # 加载并分割文件，结果缓存在磁盘上
 
 print(pages[0].page_content)  # 打印第一页的内容
 
@@ -0,0 +1,195 @@
+import json
+import os
+import sys
+
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores import FAISS
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '3.rag_embeddings'))
+from ann import IVFIndex  # noqa: E402
+from bm25 import BM25Index  # noqa: E402,F401
+from chunker import ChunkStore  # noqa: E402,F401
+from context_packer import ContextPacker  # noqa: E402,F401
+from embedder import get_backend  # noqa: E402,F401
+from embedding_cache import EmbeddingCache  # noqa: E402
+from hybrid import HybridRetriever  # noqa: E402,F401
+from ingest import IncrementalIngestor, chunk_id, iter_batches  # noqa: E402,F401
+from keywords import to_cjk_keywords, to_cjk_keywords_batch  # noqa: E402,F401
+from query_cache import QueryCache  # noqa: E402,F401
+from response_cache import ResponseCache  # noqa: E402,F401
+from streaming import StreamingRAG, print_stream  # noqa: E402,F401
+
+
+class BackendEmbeddings(Embeddings):
+    '''把 embedder.get_backend() 返回的后端包装成 langchain 的 Embeddings（例如离线用的本地哈希向量化）'''
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.model = backend.model
+        self.dimensions = backend.dimensions
+
+    def embed_documents(self, texts):
+        return self.backend.embed(texts)
+
+    def embed_query(self, text):
+        return self.backend.embed([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    '''给 langchain 的 Embeddings 加上持久化的向量缓存：相同文本（含查询）只做一次 embedding'''
+
+    def __init__(self, embeddings, model=None, dimensions=None):
+        self.embeddings = embeddings
+        self.cache = EmbeddingCache(model or getattr(embeddings, 'model', type(embeddings).__name__),
+                                    dimensions or getattr(embeddings, 'dimensions', None))
+
+    def embed_documents(self, texts):
+        # 返回映射区域上的 float32 视图，FAISS 与 IVFStore 都直接转成矩阵，不需要转成 list
+        return self.cache.embed(texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        return self.cache.embed([text], lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+
+class FaissSink:
+    '''增量灌库的 FAISS 目标：向量库保存在本地目录，以 chunk 编号作为文档 id；chunks 按 batch_size 个一批写入
+
+    灌库后可以直接检索（similarity_search），用法与 IVFStore 相同
+    '''
+
+    def __init__(self, folder, embeddings, batch_size=1000):
+        self.folder = folder
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.db = None
+        if os.path.exists(os.path.join(folder, 'index.faiss')):
+            self.db = FAISS.load_local(folder, embeddings)
+
+    def upsert(self, chunks):
+        for batch in iter_batches(chunks, self.batch_size):
+            ids = [cid for cid, _, _ in batch]
+            texts = [text for _, text, _ in batch]
+            metadatas = [dict(metadata, chunk_id=cid) for cid, _, metadata in batch]
+            # FAISS 的 docstore 不允许重复的 id：已有的 chunk 先删除再写入
+            self.delete(ids)
+            if self.db is None:
+                self.db = FAISS.from_texts(texts, self.embeddings, metadatas=metadatas, ids=ids)
+            else:
+                self.db.add_texts(texts, metadatas, ids=ids)
+
+    def delete(self, ids):
+        if self.db is None:
+            return
+        existing = set(self.db.index_to_docstore_id.values())
+        ids = [cid for cid in ids if cid in existing]
+        if ids:
+            self.db.delete(ids)
+
+    def save(self):
+        if self.db is not None:
+            self.db.save_local(self.folder)
+
+    def __len__(self):
+        return 0 if self.db is None else len(self.db.index_to_docstore_id)
+
+    def similarity_search(self, query, k=4):
+        if self.db is None or not len(self):
+            return []
+        return self.db.similarity_search(query, k)
+
+
+class IVFStore:
+    '''本地 IVF 近似检索的向量库，可以替代 FAISS：既是增量灌库的目标，也可以直接检索
+
+    向量存在 index.ivf（内存映射加载），文字与元数据存在 docstore.json；
+    增删不重新聚类，语料比聚类时增长到 retrain_ratio 倍以上时在 save 时重新聚类。
+    upsert 的 chunks 按 batch_size 个一批做 embedding 并写入。
+    '''
+
+    def __init__(self, folder, embeddings, nprobe=8, nlist=None, retrain_ratio=4, batch_size=1000):
+        self.folder = folder
+        self.batch_size = batch_size
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.retrain_ratio = retrain_ratio
+        self.index_path = os.path.join(folder, 'index.ivf')
+        self.docstore_path = os.path.join(folder, 'docstore.json')
+        self.index = None
+        self.docs = {}  # 内部编号 -> (chunk 编号, 文字, 元数据)
+        self.ids = {}   # chunk 编号 -> 内部编号
+        self.next_id = 0
+        if os.path.exists(self.index_path) and os.path.exists(self.docstore_path):
+            self.index = IVFIndex.load(self.index_path, nprobe)
+            with open(self.docstore_path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.next_id = data['next_id']
+            for ident, cid, text, metadata in data['docs']:
+                self.docs[ident] = (cid, text, metadata)
+                self.ids[cid] = ident
+
+    @classmethod
+    def from_documents(cls, documents, embeddings, folder='ivf_index', **kwargs):
+        '''与 FAISS.from_documents 用法相同'''
+        store = cls(folder, embeddings, **kwargs)
+        store.add_documents(documents)
+        return store
+
+    def add_documents(self, documents):
+        start = self.next_id
+        self.upsert([(str(start + i), doc.page_content, doc.metadata) for i, doc in enumerate(documents)])
+
+    def upsert(self, chunks):
+        for batch in iter_batches(chunks, self.batch_size):
+            vectors = self.embeddings.embed_documents([text for _, text, _ in batch])
+            idents = []
+            for cid, text, metadata in batch:
+                ident = self.ids.get(cid)
+                if ident is None:
+                    ident = self.ids[cid] = self.next_id
+                    self.next_id += 1
+                self.docs[ident] = (cid, text, metadata)
+                idents.append(ident)
+            if self.index is None:
+                self.index = IVFIndex.build(vectors, idents, self.nlist, nprobe=self.nprobe)
+            else:
+                self.index.insert(vectors, idents)
+
+    def delete(self, ids):
+        idents = [self.ids.pop(cid) for cid in ids if cid in self.ids]
+        for ident in idents:
+            del self.docs[ident]
+        if self.index is not None:
+            self.index.remove(idents)
+
+    def save(self):
+        if self.index is None:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        if len(self.index) > self.retrain_ratio * max(self.index.trained_on, 1):
+            self.index.retrain(self.nlist)
+        self.index.save(self.index_path)
+        tmp = self.docstore_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'next_id': self.next_id,
+                       'docs': [[ident, *doc] for ident, doc in self.docs.items()]}, f, ensure_ascii=False)
+        os.replace(tmp, self.docstore_path)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def similarity_search_with_score(self, query, k=4, nprobe=None):
+        if self.index is None:
+            return []
+        idents, scores = self.index.search(self.embeddings.embed_query(query), k, nprobe)
+        results = []
+        for ident, score in zip(idents, scores):
+            if ident < 0:
+                break
+            cid, text, metadata = self.docs[int(ident)]
+            results.append((Document(page_content=text, metadata=dict(metadata, chunk_id=cid)), float(score)))
+        return results
+
+    def similarity_search(self, query, k=4, nprobe=None):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, nprobe)]
@@ -0,0 +1,73 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+# 抽取缓存与 3.rag_embeddings 共用
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '3.rag_embeddings'))
+from extract_cache import ExtractCache  # noqa: E402,F401
+
+
+def _extract_page_range(path, start, end):
+    '''子进程任务：用 pypdf 提取 [start, end) 页的文字'''
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def load_pages(path, start=0, end=None, workers=1, pages_per_shard=None):
+    '''提取 [start, end) 页的文字，范围外的页不解析；结果与 PyPDFLoader(path).load() 对应页一致
+
+    workers>1 时按页范围分片多进程提取
+    '''
+    total = len(PdfReader(path).pages)
+    end = total if end is None else min(end, total)
+    start = max(0, start)
+    if start >= end:
+        return []
+    if workers > 1:
+        # 每个分片都要重新打开并解析 PDF 目录，默认每个进程只分一段连续页
+        pages_per_shard = pages_per_shard or max(1, -(-(end - start) // workers))
+        starts = list(range(start, end, pages_per_shard))
+        ends = [min(s + pages_per_shard, end) for s in starts]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map 按提交顺序返回结果，保证页码顺序
+            shards = list(executor.map(_extract_page_range, [path]*len(starts), starts, ends))
+    else:
+        starts, shards = [start], [_extract_page_range(path, start, end)]
+    docs = []
+    for shard_start, texts in zip(starts, shards):
+        for offset, text in enumerate(texts):
+            docs.append(Document(page_content=text, metadata={"source": path, "page": shard_start + offset}))
+    return docs
+
+
+def splitter_params(text_splitter):
+    '''切分器的全部参数（chunk 大小、重叠、分隔符、是否记录起始位置……），用作缓存键；长度函数取其名字'''
+    params = {}
+    for name, value in vars(text_splitter).items():
+        if callable(value):
+            value = f'{getattr(value, "__module__", None)}.{getattr(value, "__qualname__", repr(value))}'
+        params[name.lstrip('_')] = value
+    return params
+
+
+def load_and_split(path, workers=1, cache=None, start=0, end=None):
+    '''PyPDFLoader(path).load_and_split()，只解析 [start, end) 页，可选多进程解析与磁盘缓存'''
+    text_splitter = RecursiveCharacterTextSplitter()
+    if cache is not None:
+        params = {'kind': 'load_and_split', 'start': start, 'end': end, **splitter_params(text_splitter)}
+        key = cache.key_for_file(path, **params)
+        entry = cache.get(key)
+        if entry is not None:
+            return [Document(page_content=text, metadata={"source": path, "page": page})
+                    for text, page in zip(entry.texts, entry.positions)]
+    # 切分在主进程按页码顺序进行
+    pages = text_splitter.split_documents(load_pages(path, start, end, workers))
+    if cache is not None:
+        cache.put(key, [page.page_content for page in pages], positions=[page.metadata["page"] for page in pages],
+                  meta=dict(params, source=os.path.basename(path)))
+    return pages
+
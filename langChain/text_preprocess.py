@@ -0,0 +1,54 @@
+import re
+from functools import lru_cache
+
+import wordninja
+
+# 与原 preprocess 完全相同的切词规则，只编译一次
+TOKEN_PATTERN = re.compile(r'\w+|[.,!?;%$-+=@#*/]')
+# wordninja 内部先按非 ASCII 字母数字切开再逐段拆词，这里提前切开，按段缓存
+PIECE_SEPARATOR = re.compile(r"[^a-zA-Z0-9']+")
+
+
+class Preprocessor:
+    '''预处理字符全都连在一起的行，连写单词的拆分结果放在有界 LRU 缓存中复用'''
+
+    def __init__(self, cache_size=65536, min_token_length=20):
+        # 按空格切开后存在长度 >= min_token_length 的片段，才需要重新切词
+        self.long_token = re.compile(r'[^ ]{%d}' % min_token_length)
+        self.split_piece = lru_cache(maxsize=cache_size)(self._split_piece)
+
+    @staticmethod
+    def _split_piece(piece):
+        return ' '.join(wordninja.split(piece))
+
+    def split_token(self, token):
+        '''等价于 ' '.join(wordninja.split(token))，纯中文等不含 ASCII 字母数字的片段直接跳过'''
+        pieces = [self.split_piece(piece) for piece in PIECE_SEPARATOR.split(token) if piece]
+        return ' '.join(piece for piece in pieces if piece)
+
+    def process_line(self, line):
+        if not self.long_token.search(line):
+            return line
+        return ' '.join(
+            self.split_token(token) if token.isalnum() else token
+            for token in TOKEN_PATTERN.findall(line)
+        )
+
+    def process(self, text):
+        '''处理一页文本，结果与原 preprocess(text) 一致'''
+        return ' '.join(self.process_line(line) for line in text.split('\n'))
+
+    def process_batch(self, texts):
+        '''批量处理多页文本，缓存在页与页之间共享'''
+        return [self.process(text) for text in texts]
+
+    def stats(self):
+        '''切词缓存的命中情况'''
+        info = self.split_piece.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'hit_ratio': info.hits / lookups if lookups else 0.0,
+        }